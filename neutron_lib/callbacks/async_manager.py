@@ -0,0 +1,121 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# NOTE: this module uses native coroutines and requires Python 3.5 or later.
+# It is never imported by the synchronous callbacks machinery.
+
+import asyncio
+import functools
+
+from oslo_log import log as logging
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import manager
+from neutron_lib.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncCallbacksManager(object):
+    """An asyncio front-end to a CallbacksManager.
+
+    Subscriptions are held by the wrapped CallbacksManager, so the same
+    subscribers are reachable from synchronous and asynchronous notifiers.
+    Coroutine functions are awaited concurrently; plain callables are run
+    in the event loop's default executor so they do not block the loop.
+    """
+
+    def __init__(self, callbacks_manager=None):
+        self._manager = callbacks_manager or manager.CallbacksManager()
+
+    def subscribe(self, callback, resource, event, weak=False, batch=False,
+                  filters=None, timeout=None):
+        self._manager.subscribe(callback, resource, event,
+                                weak=weak, batch=batch, filters=filters,
+                                timeout=timeout)
+
+    def unsubscribe(self, callback, resource, event):
+        self._manager.unsubscribe(callback, resource, event)
+
+    def unsubscribe_by_resource(self, callback, resource):
+        self._manager.unsubscribe_by_resource(callback, resource)
+
+    def unsubscribe_all(self, callback):
+        self._manager.unsubscribe_all(callback)
+
+    def clear(self):
+        self._manager.clear()
+
+    async def notify(self, resource, event, trigger, **kwargs):
+        """Notify all subscribed callback(s).
+
+        Same semantics as CallbacksManager.notify: if any subscriber of a
+        BEFORE_* event fails, the matching ABORT_* event is dispatched and
+        CallbackFailure is raised once every subscriber has completed.
+
+        :param resource: the resource.
+        :param event: the event.
+        :param trigger: the trigger. A reference to the sender of the event.
+        """
+        errors = await self._notify_loop(resource, event, trigger, **kwargs)
+        abort_event = events.get_abort_event(event)
+        if errors and abort_event:
+            await self._notify_loop(resource, abort_event, trigger)
+            raise exceptions.CallbackFailure(errors=errors)
+
+    async def _notify_loop(self, resource, event, trigger, **kwargs):
+        """The notification loop."""
+        callbacks = self._manager._get_callbacks(resource, event)
+        if not callbacks:
+            return []
+
+        LOG.debug("Notify callbacks for %(resource)s, %(event)s",
+                  {'resource': resource, 'event': event})
+
+        calls = self._manager._get_calls(resource, event, callbacks, [kwargs])
+        loop = asyncio.get_event_loop()
+        results = await asyncio.gather(
+            *[self._notify_callback(loop, subscription.callback,
+                                    subscription.timeout,
+                                    resource, event, trigger, call_kwargs)
+              for subscription, call_kwargs in calls])
+        return [error for error in results if error]
+
+    async def _notify_callback(self, loop, callback, timeout,
+                               resource, event, trigger, kwargs):
+        """Await a single callback, returning a NotificationError on failure.
+        """
+        if isinstance(callback, manager._WeakCallback):
+            callback = callback.resolve()
+            if callback is None:
+                return
+        try:
+            LOG.debug("Calling callback %s", callback)
+            if asyncio.iscoroutinefunction(callback):
+                call = callback(resource, event, trigger, **kwargs)
+            else:
+                call = loop.run_in_executor(
+                    None, functools.partial(callback, resource, event,
+                                            trigger, **kwargs))
+            try:
+                await asyncio.wait_for(call, timeout)
+            except asyncio.TimeoutError:
+                raise exceptions.CallbackTimeout(timeout)
+        except Exception as e:
+            callback_name = manager._get_name(callback)
+            LOG.exception(_LE("Error during notification for "
+                              "%(callback)s %(resource)s, %(event)s"),
+                          {'callback': callback_name,
+                           'resource': resource,
+                           'event': event})
+            return exceptions.NotificationError(callback_name, e)
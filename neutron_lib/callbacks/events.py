@@ -10,6 +10,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import six
+
 # String literals representing core events.
 BEFORE_CREATE = 'before_create'
 BEFORE_READ = 'before_read'
@@ -27,4 +31,208 @@ ABORT_UPDATE = 'abort_update'
 ABORT_DELETE = 'abort_delete'
 
 ABORT = 'abort_'
+AFTER = 'after_'
 BEFORE = 'before_'
+
+
+_EventInfo = collections.namedtuple('_EventInfo',
+                                    ['event', 'event_class', 'abort_event'])
+
+# The registered events, keyed by name: their interned identifier, their
+# class (BEFORE, AFTER, ABORT or None) and, for BEFORE_* events, the ABORT_*
+# event sent when they fail. The core events are registered below, any
+# other event on first use.
+_EVENTS = {}
+
+
+def register(event):
+    """Register an event, precomputing its class and abort event.
+
+    :param event: the event name.
+    :returns: the interned identifier of the event, equal to its name.
+    """
+    try:
+        return _EVENTS[event].event
+    except KeyError:
+        pass
+    event = _intern(event)
+    event_class = abort_event = None
+    for prefix in (BEFORE, AFTER, ABORT):
+        if event.startswith(prefix):
+            event_class = prefix
+            break
+    if event_class == BEFORE:
+        abort_event = _intern(ABORT + event[len(BEFORE):])
+    _EVENTS[event] = _EventInfo(event, event_class, abort_event)
+    return event
+
+
+def get_event_class(event):
+    """Return the class of an event: BEFORE, AFTER, ABORT or None."""
+    return _get_info(event).event_class
+
+
+def get_abort_event(event):
+    """Return the ABORT_* event of a BEFORE_* event, None otherwise."""
+    return _get_info(event).abort_event
+
+
+def is_before(event):
+    """Return True if the event is a BEFORE_* event."""
+    return _get_info(event).event_class == BEFORE
+
+
+def is_after(event):
+    """Return True if the event is an AFTER_* event."""
+    return _get_info(event).event_class == AFTER
+
+
+def _get_info(event):
+    try:
+        return _EVENTS[event]
+    except KeyError:
+        register(event)
+        return _EVENTS[event]
+
+
+def _intern(name):
+    try:
+        return six.moves.intern(name)
+    except TypeError:
+        # Only str can be interned on Python 2.
+        return name
+
+
+for _event in (BEFORE_CREATE, BEFORE_READ, BEFORE_UPDATE, BEFORE_DELETE,
+               AFTER_CREATE, AFTER_READ, AFTER_UPDATE, AFTER_DELETE,
+               ABORT_CREATE, ABORT_READ, ABORT_UPDATE, ABORT_DELETE):
+    register(_event)
+
+
+class EventPayload(object):
+    """Base event payload object.
+
+    A typed, immutable alternative to the keyword arguments of a
+    notification, passed to the callbacks as the 'payload' keyword argument
+    by publish(). The payload objects of a notification are shared by all
+    its callbacks and must not be modified.
+    """
+
+    __slots__ = ('context', 'metadata', 'request_body', 'states',
+                 'resource_id')
+
+    def __init__(self, context, metadata=None, request_body=None,
+                 states=None, resource_id=None):
+        """Initialize the payload.
+
+        :param context: the context of the event.
+        :param metadata: a dict of arbitrary data about the event.
+        :param request_body: the body of the API request, if any.
+        :param states: the states of the resource, oldest first (e.g. the
+            original and updated resource of an update).
+        :param resource_id: the id of the resource.
+        """
+        _set = object.__setattr__
+        _set(self, 'context', context)
+        _set(self, 'metadata', metadata or {})
+        _set(self, 'request_body', request_body)
+        _set(self, 'states', tuple(states or ()))
+        _set(self, 'resource_id', resource_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Can't set attribute %s of %s" %
+                             (name, type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("Can't delete attribute %s of %s" %
+                             (name, type(self).__name__))
+
+    def __reduce__(self):
+        # The default copy and pickle protocols restore the slots through
+        # __setattr__, which the payloads reject.
+        cls = type(self)
+        return _restore_payload, (cls, tuple(getattr(self, name)
+                                             for name in _get_slots(cls)))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name))
+            for name in _get_slots(type(self)) if name != 'context'))
+
+    @property
+    def has_states(self):
+        """Return True if the payload holds any state of the resource."""
+        return bool(self.states)
+
+    @property
+    def latest_state(self):
+        """Return the latest state of the resource, None if there is none."""
+        return self.states[-1] if self.states else None
+
+
+class DBEventPayload(EventPayload):
+    """The payload of an event about a database operation."""
+
+    __slots__ = ('desired_state',)
+
+    def __init__(self, context, metadata=None, request_body=None,
+                 states=None, resource_id=None, desired_state=None):
+        """Initialize the payload.
+
+        :param desired_state: the state of the resource about to be
+            committed, if it is not persisted yet.
+        """
+        super(DBEventPayload, self).__init__(
+            context, metadata=metadata, request_body=request_body,
+            states=states, resource_id=resource_id)
+        object.__setattr__(self, 'desired_state', desired_state)
+
+    @property
+    def is_persisted(self):
+        """Return True if the resource is already persisted."""
+        return self.desired_state is None
+
+    @property
+    def latest_state(self):
+        """Return the desired state of the resource, or its latest state."""
+        if self.desired_state is not None:
+            return self.desired_state
+        return super(DBEventPayload, self).latest_state
+
+
+class APIEventPayload(EventPayload):
+    """The payload of an event about an API request."""
+
+    __slots__ = ('method_name', 'action', 'collection_name')
+
+    def __init__(self, context, method_name, action, metadata=None,
+                 request_body=None, states=None, resource_id=None,
+                 collection_name=None):
+        """Initialize the payload.
+
+        :param method_name: the name of the plugin method handling the
+            request.
+        :param action: the action of the request (e.g. 'create_port').
+        :param collection_name: the name of the collection of the resource.
+        """
+        super(APIEventPayload, self).__init__(
+            context, metadata=metadata, request_body=request_body,
+            states=states, resource_id=resource_id)
+        _set = object.__setattr__
+        _set(self, 'method_name', method_name)
+        _set(self, 'action', action)
+        _set(self, 'collection_name', collection_name)
+
+
+def _restore_payload(cls, values):
+    """Return a payload of a class with the given slot values."""
+    payload = cls.__new__(cls)
+    for name, value in zip(_get_slots(cls), values):
+        object.__setattr__(payload, name, value)
+    return payload
+
+
+def _get_slots(cls):
+    """Return the slot names of a payload class, base classes first."""
+    return [name for klass in reversed(cls.__mro__)
+            for name in klass.__dict__.get('__slots__', ())]
@@ -29,6 +29,24 @@ class CallbackFailure(Exception):
             return str(self.errors)
 
 
+class CallbackTimeout(Exception):
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __str__(self):
+        return 'Timed out after %s seconds' % self.timeout
+
+
+class CallbackSkipped(Exception):
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __str__(self):
+        return 'Skipped after %d consecutive failures' % self.failures
+
+
 class NotificationError(object):
 
     def __init__(self, callback_id, error):
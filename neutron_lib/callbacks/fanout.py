@@ -0,0 +1,216 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import glob
+import os
+
+import eventlet
+from eventlet.green import socket
+from oslo_log import log as logging
+from oslo_serialization import msgpackutils
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import registry
+from neutron_lib.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+# Large enough for any datagram accepted by a unix socket with the default
+# Linux socket buffer sizes.
+MAX_DATAGRAM_SIZE = 2 ** 18
+
+
+class WorkerFanout(object):
+    """Forward selected events to the sibling workers of a process.
+
+    Every worker binds a unix datagram socket in a directory shared by all
+    the workers of a service. Events selected with forward() are queued as
+    they are notified locally, and sent in batches to every other socket of
+    the directory, where they are notified again, with this object as the
+    trigger, to the subscribers of the receiving worker.
+
+    Batches are sent without blocking: those a sibling is too slow to
+    receive are dropped and counted, see get_stats(), so that a stalled
+    worker never stalls the notifications of the others.
+
+    Only AFTER_* events can be forwarded, as the remote subscribers cannot
+    abort the operation. Payloads are serialized with msgpack: the keyword
+    arguments that cannot be (e.g. a context) are dropped, so subscribers
+    relying on them should only be sent the keys selected with forward().
+    """
+
+    def __init__(self, path, callbacks_manager=None, worker_id=None,
+                 batch_size=100, flush_interval=0.05):
+        """Initialize the fan-out.
+
+        :param path: the directory shared by the sibling workers.
+        :param callbacks_manager: the manager events are forwarded from and
+            notified to, the registry one by default.
+        :param worker_id: the name of the socket of this worker in path, the
+            pid of the process by default.
+        :param batch_size: the number of events triggering a flush.
+        :param flush_interval: the time, in seconds, after which queued
+            events are flushed even if the batch is not full.
+        """
+        self._path = path
+        self._manager = (callbacks_manager or
+                         registry._get_callback_manager())
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._address = os.path.join(
+            path, '%s.sock' % (worker_id or os.getpid()))
+        self._keys = {}
+        self._queue = []
+        self._timer = None
+        self._flush_pending = False
+        self._socket = None
+        self._sender = None
+        self._receiver = None
+        self._sent = 0
+        self._dropped = 0
+
+    def forward(self, resource, event, keys=None):
+        """Forward a resource event to the sibling workers.
+
+        :param resource: the resource.
+        :param event: the event. It must be an AFTER_* event.
+        :param keys: the keyword arguments of the notification to forward,
+            all of them by default.
+        """
+        if not events.is_after(event):
+            raise exceptions.Invalid(element='event', value=event)
+        self._keys[resource, event] = keys
+        self._manager.subscribe(self._enqueue, resource, event)
+
+    def get_stats(self):
+        """Return the number of events sent to, and dropped for, siblings.
+
+        :returns: a dict with the number of events 'sent' and 'dropped',
+            counted once per sibling worker.
+        """
+        return {'sent': self._sent, 'dropped': self._dropped}
+
+    def start(self):
+        """Bind the socket of this worker and start receiving events."""
+        if os.path.exists(self._address):
+            # Left behind by a previous process with the same worker id.
+            os.unlink(self._address)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._address)
+        self._receiver = eventlet.spawn(self._receive_loop)
+
+    def stop(self):
+        """Flush the pending events and stop receiving events."""
+        self.flush()
+        self._manager.unsubscribe_all(self._enqueue)
+        if self._receiver is not None:
+            self._receiver.kill()
+            self._receiver = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            os.unlink(self._address)
+
+    def flush(self):
+        """Send the queued events to the sibling workers."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._flush_pending = False
+        batch, self._queue = self._queue, []
+        if not batch:
+            return
+        peers = [peer for peer in glob.glob(os.path.join(self._path, '*.sock'))
+                 if peer != self._address]
+        if peers:
+            try:
+                data = msgpackutils.dumps(batch)
+            except (TypeError, ValueError):
+                batch = [(resource, event, _get_serializable(kwargs))
+                         for resource, event, kwargs in batch]
+                data = msgpackutils.dumps(batch)
+            for peer in peers:
+                self._send(batch, data, peer)
+
+    def _enqueue(self, resource, event, trigger, **kwargs):
+        if trigger is self:
+            # Received from a sibling, do not send it back.
+            return
+        keys = self._keys.get((resource, event))
+        if keys is not None:
+            kwargs = dict((key, kwargs[key]) for key in keys if key in kwargs)
+        self._queue.append((resource, event, kwargs))
+        if len(self._queue) >= self._batch_size:
+            if not self._flush_pending:
+                # Flushed from another green thread, the notifier does not
+                # wait for the siblings.
+                self._flush_pending = True
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = eventlet.spawn(self.flush)
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self._flush_interval,
+                                               self.flush)
+
+    def _send(self, batch, data, peer):
+        if self._sender is None:
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+        try:
+            self._sender.sendto(data, peer)
+            self._sent += len(batch)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._dropped += len(batch)
+                LOG.debug("Worker socket %(peer)s is full, dropped %(count)d "
+                          "events", {'peer': peer, 'count': len(batch)})
+            elif e.errno == errno.EMSGSIZE and len(batch) > 1:
+                # Too large for a single datagram, split the batch.
+                for half in (batch[:len(batch) // 2],
+                             batch[len(batch) // 2:]):
+                    self._send(half, msgpackutils.dumps(half), peer)
+            elif e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                LOG.debug("Worker socket %s is gone", peer)
+            else:
+                LOG.exception(_LE("Error forwarding events to %s"), peer)
+
+    def _receive_loop(self):
+        while self._socket is not None:
+            try:
+                self._receive()
+            except Exception:
+                LOG.exception(_LE("Error receiving forwarded events"))
+
+    def _receive(self):
+        """Notify the events of a single batch sent by a sibling."""
+        data = self._socket.recv(MAX_DATAGRAM_SIZE)
+        for resource, event, kwargs in msgpackutils.loads(data):
+            self._manager.notify(resource, event, self, **kwargs)
+
+
+def _get_serializable(kwargs):
+    """Return the keyword arguments of an event msgpack can serialize."""
+    serializable = {}
+    for key, value in kwargs.items():
+        try:
+            msgpackutils.dumps(value)
+        except (TypeError, ValueError):
+            LOG.debug("Not forwarding argument %s, it cannot be serialized",
+                      key)
+            continue
+        serializable[key] = value
+    return serializable
@@ -0,0 +1,299 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import fcntl
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_serialization import msgpackutils
+from oslo_utils import excutils
+from oslo_utils import reflection
+import six
+
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import registry
+from neutron_lib.i18n import _LE
+from neutron_lib.i18n import _LW
+
+LOG = logging.getLogger(__name__)
+
+# Every entry is a msgpack encoded list prefixed with its length; segments
+# are filled with zeroes when created, so a zero length marks the end of a
+# segment.
+_HEADER = struct.Struct('>I')
+_SEGMENT_PATTERN = 'events-%08d.journal'
+_SEGMENT_GLOB = 'events-%s.journal' % ('[0-9]' * 8)
+_ZEROES = b'\0' * 65536
+
+
+class EventJournal(object):
+    """An append-only journal of the notifications of a callbacks manager.
+
+    Every notification is appended to memory mapped segment files of a
+    fixed size, which are rotated when full; only the newest max_segments
+    segments are kept. Nothing is synced to disk explicitly on the
+    notification path, the kernel writes the mapped pages back on its own.
+    The journal can be read back with read_journal() and replayed through
+    another manager with replay().
+
+    Several processes may share the same directory: every segment file is
+    created exclusively and locked by its writer, so that it is neither
+    overwritten nor removed by the others. The max_segments newest segments
+    are then kept across all of them.
+    """
+
+    def __init__(self, path, callbacks_manager=None, keys=None,
+                 segment_size=16 * 1024 * 1024, max_segments=8):
+        """Initialize the journal.
+
+        :param path: the directory of the segment files.
+        :param callbacks_manager: the manager to record, the registry one by
+            default.
+        :param keys: the keyword arguments of the notifications to record,
+            all those that can be serialized by default.
+        :param segment_size: the size of a segment file, in bytes.
+        :param max_segments: the number of segment files kept.
+        """
+        self._path = path
+        self._manager = (callbacks_manager or
+                         registry._get_callback_manager())
+        self._keys = keys
+        self._segment_size = segment_size
+        self._max_segments = max_segments
+        self._lock = threading.Lock()
+        self._recording = False
+        self._file = None
+        self._map = None
+        self._offset = 0
+        segments = _get_segments(path)
+        self._segment = _get_segment_number(segments[-1]) if segments else 0
+
+    def start(self):
+        """Start recording every notification of the manager."""
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+        with self._lock:
+            self._rotate()
+            self._recording = True
+        self._manager.subscribe(self._record, '*', '*', batch=True)
+
+    def stop(self):
+        """Stop recording and close the current segment."""
+        self._manager.unsubscribe_all(self._record)
+        with self._lock:
+            self._recording = False
+            self._close_segment()
+
+    def _record(self, resource, event, trigger, payloads):
+        # Subscribed to every event: failing would abort the BEFORE_* ones.
+        try:
+            trigger_name = _get_trigger_name(trigger)
+            timestamp = time.time()
+            entries = [self._encode([timestamp, resource, event, trigger_name,
+                                     self._select(payload)])
+                       for payload in payloads]
+            with self._lock:
+                for entry in entries:
+                    self._append(entry)
+        except Exception:
+            LOG.exception(_LE("Unable to journal %(resource)s, %(event)s"),
+                          {'resource': resource, 'event': event})
+
+    def _select(self, kwargs):
+        if self._keys is not None:
+            return dict((key, kwargs[key])
+                        for key in self._keys if key in kwargs)
+        return kwargs
+
+    def _encode(self, entry):
+        try:
+            data = msgpackutils.dumps(entry)
+        except (TypeError, ValueError):
+            # Drop the arguments that cannot be serialized.
+            kwargs = entry[-1]
+            entry[-1] = dict((key, value) for key, value in kwargs.items()
+                             if _is_serializable(value))
+            data = msgpackutils.dumps(entry)
+        return _HEADER.pack(len(data)) + data
+
+    def _append(self, entry):
+        if not self._recording:
+            # Stopped while the notification was being dispatched.
+            return
+        if len(entry) + _HEADER.size > self._segment_size:
+            LOG.warning(_LW("Journal entry of %d bytes exceeds the segment "
+                            "size, dropping it"), len(entry))
+            return
+        if (self._map is None or
+                self._offset + len(entry) + _HEADER.size >
+                self._segment_size):
+            # The segment is full, or its creation failed.
+            self._rotate()
+        self._map[self._offset:self._offset + len(entry)] = entry
+        self._offset += len(entry)
+
+    def _rotate(self):
+        self._close_segment()
+        self._offset = 0
+        self._file = self._create_segment()
+        self._map = mmap.mmap(self._file.fileno(), self._segment_size)
+        for stale in _get_segments(self._path)[:-self._max_segments]:
+            _remove_segment(stale)
+
+    def _create_segment(self):
+        """Create, lock and allocate the next segment file."""
+        while True:
+            self._segment += 1
+            name = os.path.join(self._path,
+                                _SEGMENT_PATTERN % self._segment)
+            try:
+                fd = os.open(name, os.O_RDWR | os.O_CREAT | os.O_EXCL)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                # Created by another process sharing the directory.
+                continue
+            segment = os.fdopen(fd, 'r+b')
+            try:
+                fcntl.flock(segment, fcntl.LOCK_EX)
+                _allocate(segment, self._segment_size)
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    segment.close()
+                    os.unlink(name)
+            return segment
+
+    def _close_segment(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            # Give back the unused, preallocated tail of the segment.
+            self._file.truncate(self._offset)
+            self._file.close()
+            self._file = None
+
+
+def read_journal(path):
+    """Yield the entries of a journal, oldest first.
+
+    :param path: the directory of the segment files.
+    :returns: an iterator of (timestamp, resource, event, trigger_name,
+        kwargs) tuples.
+    """
+    for segment in _get_segments(path):
+        with open(segment, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                continue
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                offset = 0
+                while offset + _HEADER.size <= size:
+                    length, = _HEADER.unpack_from(data, offset)
+                    if not length:
+                        break
+                    offset += _HEADER.size
+                    entry = msgpackutils.loads(data[offset:offset + length])
+                    offset += length
+                    yield tuple(entry)
+            finally:
+                data.close()
+
+
+def replay(path, callbacks_manager=None):
+    """Notify the entries of a journal through a callbacks manager.
+
+    The trigger of every notification is the name of the original trigger.
+
+    :param path: the directory of the segment files.
+    :param callbacks_manager: the manager to notify, a new one by default.
+    :returns: the number of notifications replayed and of those that failed.
+    """
+    callbacks_manager = callbacks_manager or manager.CallbacksManager()
+    replayed = failed = 0
+    for _timestamp, resource, event, trigger_name, kwargs in read_journal(
+            path):
+        replayed += 1
+        try:
+            callbacks_manager.notify(resource, event, trigger_name, **kwargs)
+        except exceptions.CallbackFailure:
+            failed += 1
+    return replayed, failed
+
+
+def _allocate(segment, size):
+    """Allocate the blocks of a segment file.
+
+    Writing through a memory map into a hole of a sparse file raises SIGBUS
+    when the file system is full, so the blocks are allocated beforehand.
+    """
+    try:
+        os.posix_fallocate(segment.fileno(), 0, size)
+        return
+    except AttributeError:
+        # Python 2 has no posix_fallocate.
+        pass
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+    remaining = size
+    while remaining:
+        written = min(remaining, len(_ZEROES))
+        segment.write(_ZEROES[:written])
+        remaining -= written
+    segment.flush()
+
+
+def _remove_segment(segment):
+    """Remove a segment file, unless it is locked by its writer."""
+    try:
+        with open(segment, 'rb') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                # Still written to, by a journal of another process.
+                return
+            os.unlink(segment)
+    except (IOError, OSError):
+        LOG.exception(_LE("Unable to remove journal segment %s"), segment)
+
+
+def _get_segments(path):
+    return sorted(glob.glob(os.path.join(path, _SEGMENT_GLOB)))
+
+
+def _get_segment_number(segment):
+    return int(os.path.basename(segment).split('-')[1].split('.')[0])
+
+
+def _get_trigger_name(trigger):
+    if isinstance(trigger, six.string_types):
+        return trigger
+    return reflection.get_class_name(trigger)
+
+
+def _is_serializable(value):
+    try:
+        msgpackutils.dumps(value)
+    except (TypeError, ValueError):
+        return False
+    return True
@@ -11,47 +11,128 @@
 #    under the License.
 
 import collections
+import fnmatch
+import threading
+import time
+import types
+import weakref
 
+import eventlet
 from oslo_log import log as logging
 from oslo_utils import reflection
+import six
 
 from neutron_lib.callbacks import events
 from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import resources
 from neutron_lib.i18n import _LE
+from neutron_lib.i18n import _LW
 
 LOG = logging.getLogger(__name__)
 
+try:
+    _now = time.monotonic
+except AttributeError:
+    # Python 2.7
+    _now = time.time
+
+# Number of buckets of the callback latency histograms: bucket N counts the
+# calls that took less than 2**N microseconds, the last one everything else.
+HISTOGRAM_BUCKETS = 32
+
 
 class CallbacksManager(object):
-    """A callback system that allows objects to cooperate in a loose manner."""
+    """A callback system that allows objects to cooperate in a loose manner.
+
+    The manager is safe for concurrent use: subscriptions are serialized by a
+    lock, while notifications run lock free against the dispatch table, which
+    is replaced as a whole (copy-on-write) whenever subscriptions change.
+    """
 
-    def __init__(self):
+    def __init__(self, max_workers=0, collect_stats=False,
+                 callback_timeout=None, failure_threshold=0,
+                 failure_cooldown=60):
+        """Initialize the manager.
+
+        :param max_workers: the number of green threads used to dispatch
+            AFTER_* events concurrently. The default (0) dispatches every
+            event serially, in the calling thread.
+        :param collect_stats: whether to record per callback call counts,
+            latencies and errors; see get_stats.
+        :param callback_timeout: the default time, in seconds, a callback
+            may run before it is considered failed; see subscribe.
+        :param failure_threshold: the number of consecutive failures (or
+            timeouts) after which a callback is skipped for failure_cooldown
+            seconds; see get_breaker_stats. The default (0) never skips
+            callbacks.
+        :param failure_cooldown: the time, in seconds, a failing callback is
+            skipped for. The next call after the cool-down is a trial: a
+            single failure skips the callback again.
+        """
+        self._max_workers = max_workers
+        self._stats = {} if collect_stats else None
+        self._callback_timeout = callback_timeout
+        self._failure_threshold = failure_threshold
+        self._failure_cooldown = failure_cooldown
+        # Reentrant, as weak subscriptions may be purged by the garbage
+        # collector while the lock is held by the same thread.
+        self._lock = threading.RLock()
         self.clear()
 
-    def subscribe(self, callback, resource, event):
+    def subscribe(self, callback, resource, event, weak=False, batch=False,
+                  filters=None, timeout=None):
         """Subscribe callback for a resource event.
 
-        The same callback may register for more than one event.
+        The same callback may register for more than one event. Either the
+        resource or the event may be a shell-style wildcard (e.g. '*' or
+        'after_*'), in which case the callback is subscribed to any matching
+        resource event; a callback matched more than once for the same
+        resource event is only called once.
 
         :param callback: the callback. It must raise or return a boolean.
-        :param resource: the resource. It must be a valid resource.
-        :param event: the event. It must be a valid event.
+        :param resource: the resource. It must be a valid resource, or a
+            wildcard pattern.
+        :param event: the event. It must be a valid event, or a wildcard
+            pattern.
+        :param weak: if True, the manager only keeps a weak reference to the
+            callback (or to the instance a bound method belongs to), and the
+            callback is unsubscribed from everything when it is garbage
+            collected.
+        :param batch: if True, the callback receives the list of payloads
+            passed to notify_many in a single call, as the 'payloads' keyword
+            argument; events sent with notify are delivered as a batch of one.
+        :param filters: a dict mapping a dotted key path into the keyword
+            arguments of a notification (e.g. 'port.device_owner') to the
+            values it may take for the callback to be called. Notifications
+            that do not match every filter are not dispatched to the
+            callback; see get_filter_stats.
+        :param timeout: the time, in seconds, the callback may run before
+            the notification is considered failed, the callback_timeout of
+            the manager by default. As it relies on eventlet timeouts, only
+            callbacks yielding to the hub (e.g. doing green I/O) can be
+            interrupted.
         """
         LOG.debug("Subscribe: %(callback)s %(resource)s %(event)s",
                   {'callback': callback, 'resource': resource, 'event': event})
 
+        # Dispatch keys are interned, so that lookups with the core resource
+        # and event constants compare by identity.
+        if not _is_pattern(resource):
+            resource = resources.register(resource)
+        if not _is_pattern(event):
+            event = events.register(event)
         callback_id = _get_id(callback)
-        try:
-            self._callbacks[resource][event][callback_id] = callback
-        except KeyError:
-            # Initialize the registry for unknown resources and/or events
-            # prior to enlisting the callback.
-            self._callbacks[resource][event] = {}
-            self._callbacks[resource][event][callback_id] = callback
-        # We keep a copy of callbacks to speed the unsubscribe operation.
-        if callback_id not in self._index:
-            self._index[callback_id] = collections.defaultdict(set)
-        self._index[callback_id][resource].add(event)
+        if weak:
+            callback = _WeakCallback(callback, self._get_purger(callback_id))
+        subscription = _Subscription(callback_id, callback, batch,
+                                     _compile_filters(filters),
+                                     timeout or self._callback_timeout)
+        with self._lock:
+            self._get_subscriptions(resource, event)[callback_id] = (
+                subscription)
+            # We keep a copy of callbacks to speed the unsubscribe operation.
+            self._get_index(callback_id)[resource].add(event)
+            self._update_dispatch(resource, event)
 
     def unsubscribe(self, callback, resource, event):
         """Unsubscribe callback from the registry.
@@ -63,20 +144,24 @@ class CallbacksManager(object):
         LOG.debug("Unsubscribe: %(callback)s %(resource)s %(event)s",
                   {'callback': callback, 'resource': resource, 'event': event})
 
-        callback_id = self._find(callback)
-        if not callback_id:
-            LOG.debug("Callback %s not found", callback_id)
-            return
-        if resource and event:
-            del self._callbacks[resource][event][callback_id]
-            self._index[callback_id][resource].discard(event)
-            if not self._index[callback_id][resource]:
-                del self._index[callback_id][resource]
-                if not self._index[callback_id]:
+        with self._lock:
+            callback_id = self._find(callback)
+            if callback_id is None:
+                LOG.debug("Callback %s not found", callback)
+                return
+            if not (resource and event):
+                value = '%s,%s' % (resource, event)
+                raise exceptions.Invalid(element='resource,event',
+                                         value=value)
+            del self._get_subscriptions(resource, event)[callback_id]
+            self._update_dispatch(resource, event)
+            index = self._get_index(callback_id)
+            index[resource].discard(event)
+            if not index[resource]:
+                del index[resource]
+                if not index:
                     del self._index[callback_id]
-        else:
-            value = '%s,%s' % (resource, event)
-            raise exceptions.Invalid(element='resource,event', value=value)
+                    self._forget(callback_id)
 
     def unsubscribe_by_resource(self, callback, resource):
         """Unsubscribe callback for any event associated to the resource.
@@ -84,14 +169,19 @@ class CallbacksManager(object):
         :param callback: the callback.
         :param resource: the resource.
         """
-        callback_id = self._find(callback)
-        if callback_id:
-            if resource in self._index[callback_id]:
-                for event in self._index[callback_id][resource]:
-                    del self._callbacks[resource][event][callback_id]
-                del self._index[callback_id][resource]
-                if not self._index[callback_id]:
-                    del self._index[callback_id]
+        with self._lock:
+            callback_id = self._find(callback)
+            if callback_id is not None:
+                if resource in self._index[callback_id]:
+                    index = self._get_index(callback_id)
+                    for event in index[resource]:
+                        del self._get_subscriptions(
+                            resource, event)[callback_id]
+                        self._update_dispatch(resource, event)
+                    del index[resource]
+                    if not index:
+                        del self._index[callback_id]
+                        self._forget(callback_id)
 
     def unsubscribe_all(self, callback):
         """Unsubscribe callback for all events and all resources.
@@ -99,12 +189,10 @@ class CallbacksManager(object):
 
         :param callback: the callback.
         """
-        callback_id = self._find(callback)
-        if callback_id:
-            for resource, resource_events in self._index[callback_id].items():
-                for event in resource_events:
-                    del self._callbacks[resource][event][callback_id]
-            del self._index[callback_id]
+        with self._lock:
+            callback_id = self._find(callback)
+            if callback_id is not None:
+                self._remove(callback_id)
 
     def notify(self, resource, event, trigger, **kwargs):
         """Notify all subscribed callback(s).
@@ -115,39 +203,545 @@ class CallbacksManager(object):
         :param event: the event.
         :param trigger: the trigger. A reference to the sender of the event.
         """
-        errors = self._notify_loop(resource, event, trigger, **kwargs)
-        if errors and event.startswith(events.BEFORE):
-            abort_event = event.replace(
-                events.BEFORE, events.ABORT)
-            self._notify_loop(resource, abort_event, trigger)
-            raise exceptions.CallbackFailure(errors=errors)
+        self._notify(resource, event, trigger, kwargs, {})
+
+    def publish(self, resource, event, trigger, payload=None):
+        """Notify all subscribed callback(s) with an event payload object.
+
+        The callbacks receive the payload as their only keyword argument,
+        'payload'; unlike notify, the ABORT_* event sent when a BEFORE_*
+        event fails carries the payload as well.
+
+        :param resource: the resource.
+        :param event: the event.
+        :param trigger: the trigger. A reference to the sender of the event.
+        :param payload: the event payload, an events.EventPayload instance.
+        """
+        if payload is not None and not isinstance(payload,
+                                                  events.EventPayload):
+            raise exceptions.Invalid(element='event payload',
+                                     value=type(payload))
+        kwargs = {'payload': payload}
+        self._notify(resource, event, trigger, kwargs, kwargs)
+
+    def notify_many(self, resource, event, trigger, payloads):
+        """Notify all subscribed callback(s) of a batch of events.
+
+        Callbacks subscribed with batch=True are called once with the whole
+        batch, any other callback is called once per payload. If a BEFORE_*
+        event fails for any payload, the ABORT_* event is sent once for the
+        batch.
+
+        :param resource: the resource.
+        :param event: the event.
+        :param trigger: the trigger. A reference to the sender of the event.
+        :param payloads: a list of dicts, each holding the keyword arguments
+            of a single notification.
+        """
+        if not payloads:
+            return
+        errors = self._notify_batch_loop(resource, event, trigger, payloads)
+        if errors:
+            abort_event = events.get_abort_event(event)
+            if abort_event:
+                self._notify_loop(resource, abort_event, trigger)
+                raise exceptions.CallbackFailure(errors=errors)
+
+    def coalesce(self, resource, event, window, get_object_id=None):
+        """Collapse bursts of notifications about the same object.
+
+        Once enabled, the first notification about an object is held back
+        for 'window' seconds; notifications for the same object received in
+        the meantime replace it, and only the latest one is dispatched when
+        the window expires. Notifications whose object id cannot be found
+        are dispatched right away. Only AFTER_* events may be coalesced, as
+        BEFORE_* events must be able to abort the operation.
+
+        :param resource: the resource.
+        :param event: the event.
+        :param window: the coalescing window, in seconds. A falsy value
+            disables coalescing for the resource event.
+        :param get_object_id: a callable returning the id of the object a
+            notification is about, given its keyword arguments. By default
+            the 'id' of the resource dict (i.e. kwargs[resource]['id']), or
+            the resource_id of the payload of published events.
+        """
+        if not events.is_after(event):
+            raise exceptions.Invalid(element='event', value=event)
+        if window:
+            self._coalesce[resource, event] = (
+                window, get_object_id or _get_object_id(resource))
+            self._coalesce_counters.setdefault(
+                (resource, event),
+                {'received': 0, 'dispatched': 0, 'suppressed': 0})
+        else:
+            self._coalesce.pop((resource, event), None)
+
+    def get_coalesce_counters(self):
+        """Return the coalescing counters of each resource event.
+
+        :returns: a dict mapping (resource, event) to a dict with the number
+            of notifications 'received', 'dispatched' and 'suppressed' (that
+            is, replaced by a later one within the coalescing window).
+        """
+        return dict((key, dict(counters))
+                    for key, counters in self._coalesce_counters.items())
+
+    def enable_stats(self, enabled=True):
+        """Start (and reset) or stop collecting callback statistics."""
+        self._stats = {} if enabled else None
+
+    def get_stats(self):
+        """Return the statistics collected for every callback.
+
+        :returns: a list of dicts, one per callback and resource event, with
+            the 'callback' name, the 'resource', the 'event', the number of
+            'calls' and 'errors', the 'total_time' and 'max_time' spent in
+            the callback (in seconds), and a latency 'histogram' mapping the
+            upper bound of each non empty bucket (in microseconds, None for
+            the last bucket) to the number of calls falling into it.
+        """
+        if self._stats is None:
+            return []
+        return [stats.to_dict(resource, event)
+                for (_id, resource, event), stats in
+                list(self._stats.items())]
+
+    def get_filter_stats(self):
+        """Return the number of calls skipped by subscription filters.
+
+        :returns: a list of dicts, one per callback and resource event, with
+            the 'callback' name, the 'resource', the 'event' and the number
+            of notifications 'skipped' because they did not match the
+            filters of the subscription.
+        """
+        return [{'callback': name, 'resource': resource, 'event': event,
+                 'skipped': skipped}
+                for (_id, resource, event), (name, skipped) in
+                list(self._skipped.items())]
+
+    def get_breaker_stats(self):
+        """Return the circuit breaker state of every callback that failed.
+
+        :returns: a list of dicts, one per callback, with the 'callback'
+            name, the number of consecutive 'failures', the number of times
+            the callback was tripped ('trips'), the number of notifications
+            'skipped' while it was, and whether it is currently 'open' (that
+            is, skipped).
+        """
+        now = _now()
+        return [{'callback': breaker.name,
+                 'failures': breaker.failures,
+                 'trips': breaker.trips,
+                 'skipped': breaker.skipped,
+                 'open': breaker.open_until > now}
+                for breaker in list(self._breakers.values())]
+
+    def snapshot(self):
+        """Capture the subscriptions of the manager.
+
+        Snapshots share the subscriptions with the manager, only the outer
+        containers are copied: the subscriptions of a resource event or the
+        index entry of a callback are copied on their first change after a
+        snapshot. Taking a snapshot thus costs the number of subscribed
+        resource events and callbacks, not of subscriptions, and restoring
+        it about as much.
+
+        :returns: an opaque token to pass to restore; it can be restored any
+            number of times.
+        """
+        with self._lock:
+            token = _Snapshot(
+                dict((resource, dict(resource_events))
+                     for resource, resource_events in self._callbacks.items()),
+                dict(self._index), self._dispatch, self._patterns,
+                dict(self._coalesce))
+            self._owned = set()
+            self._owned_ids = set()
+        return token
+
+    def restore(self, token):
+        """Bring the manager back to the state captured by snapshot.
+
+        The subscriptions and coalescing windows of the snapshot replace the
+        current ones; the notifications held back for coalescing, the
+        counters and the statistics are reset.
+
+        :param token: a token returned by snapshot.
+        """
+        with self._lock:
+            self._callbacks = collections.defaultdict(dict, (
+                (resource, dict(resource_events))
+                for resource, resource_events in token.callbacks.items()))
+            self._index = collections.defaultdict(dict, token.index)
+            self._dispatch = token.dispatch
+            self._patterns = token.patterns
+            self._coalesce = dict(token.coalesce)
+            self._owned = set()
+            self._owned_ids = set()
+            self._reset_state()
 
     def clear(self):
         """Brings the manager to a clean slate."""
-        self._callbacks = collections.defaultdict(dict)
-        self._index = collections.defaultdict(dict)
+        with self._lock:
+            self._callbacks = collections.defaultdict(dict)
+            self._index = collections.defaultdict(dict)
+            # The subscription dicts and index entries changed since the last
+            # snapshot, all of them when None: any other is shared with a
+            # snapshot and copied before it is changed.
+            self._owned = None
+            self._owned_ids = None
+            # Precompiled dispatch table: (resource, event) -> tuple of
+            # subscriptions, so that the notification loop does not have to
+            # walk the nested dicts. It is never modified in place: a new
+            # table is swapped in whenever a subscription changes.
+            self._dispatch = {}
+            # The (resource, event) wildcard patterns having subscribers.
+            # Their subscribers are merged into the dispatch table entries
+            # they match, which are compiled on first use.
+            self._patterns = frozenset()
+            # Coalescing windows: (resource, event) -> (window,
+            # get_object_id).
+            self._coalesce = {}
+            self._reset_state()
+
+    def _reset_state(self):
+        """Drop the held back notifications, the counters and statistics.
+
+        Must be called with the lock held.
+        """
+        # The notifications currently held back, keyed by object.
+        self._coalesced = {}
+        self._coalesce_counters = dict(
+            (key, {'received': 0, 'dispatched': 0, 'suppressed': 0})
+            for key in self._coalesce)
+        if self._stats is not None:
+            self._stats = {}
+        self._skipped = {}
+        self._breakers = {}
+
+    def _notify(self, resource, event, trigger, kwargs, abort_kwargs):
+        """Dispatch a single notification, aborting failed BEFORE_* events.
+        """
+        if self._coalesce and (resource, event) in self._coalesce:
+            if self._defer_coalesced(resource, event, trigger, kwargs):
+                return
+        errors = self._notify_batch_loop(resource, event, trigger, [kwargs])
+        if errors:
+            # Only looked up on failure, so that notifying costs nothing more
+            # than the dispatch lookup when nobody is subscribed.
+            abort_event = events.get_abort_event(event)
+            if abort_event:
+                self._notify_batch_loop(resource, abort_event, trigger,
+                                        [abort_kwargs])
+                raise exceptions.CallbackFailure(errors=errors)
+
+    def _defer_coalesced(self, resource, event, trigger, kwargs):
+        """Hold back a notification, return False if it must be sent now."""
+        window, get_object_id = self._coalesce[resource, event]
+        try:
+            object_id = get_object_id(kwargs)
+        except (KeyError, TypeError, AttributeError):
+            object_id = None
+        if object_id is None:
+            return False
+        counters = self._coalesce_counters[resource, event]
+        counters['received'] += 1
+        key = (resource, event, object_id)
+        notification = (trigger, kwargs)
+        # setdefault is atomic, so that only one timer is started per key.
+        if self._coalesced.setdefault(key, notification) is notification:
+            eventlet.spawn_after(window, self._flush_coalesced, key)
+        else:
+            counters['suppressed'] += 1
+            self._coalesced[key] = notification
+        return True
+
+    def _flush_coalesced(self, key):
+        """Dispatch the latest notification held back for key."""
+        try:
+            trigger, kwargs = self._coalesced.pop(key)
+        except KeyError:
+            # The manager was cleared in the meantime.
+            return
+        resource, event, _object_id = key
+        counters = self._coalesce_counters.get((resource, event))
+        if counters is not None:
+            counters['dispatched'] += 1
+        self._notify_loop(resource, event, trigger, **kwargs)
+
+    def _remove(self, callback_id):
+        """Drop every subscription of the given callback_id.
+
+        Must be called with the lock held.
+        """
+        for resource, resource_events in self._index[callback_id].items():
+            for event in resource_events:
+                del self._get_subscriptions(resource, event)[callback_id]
+                self._update_dispatch(resource, event)
+        del self._index[callback_id]
+        self._forget(callback_id)
+
+    def _forget(self, callback_id):
+        """Drop the breaker and statistics of an unsubscribed callback_id.
+
+        The id of a callback other than a bound method, or of the instance
+        of a bound method, may be reused by another object once the callback
+        is collected. Must be called with the lock held.
+        """
+        self._breakers.pop(callback_id, None)
+        for counters in (self._stats, self._skipped):
+            if counters:
+                for key in [key for key in list(counters)
+                            if key[0] == callback_id]:
+                    counters.pop(key, None)
+
+    def _get_subscriptions(self, resource, event):
+        """Return the subscriptions of a resource event, for modification.
+
+        Must be called with the lock held.
+        """
+        subscriptions = self._callbacks[resource].get(event)
+        if subscriptions is None:
+            # Initialize the registry for unknown resources and/or events
+            # prior to enlisting the callback.
+            subscriptions = self._callbacks[resource][event] = {}
+        elif self._owned is not None and (resource, event) not in self._owned:
+            # Shared with a snapshot: copy it before the first change.
+            subscriptions = self._callbacks[resource][event] = dict(
+                subscriptions)
+        else:
+            return subscriptions
+        if self._owned is not None:
+            self._owned.add((resource, event))
+        return subscriptions
+
+    def _get_index(self, callback_id):
+        """Return the index entry of a callback_id, for modification.
+
+        Must be called with the lock held.
+        """
+        index = self._index.get(callback_id)
+        if index is None:
+            index = self._index[callback_id] = collections.defaultdict(set)
+        elif self._owned_ids is not None and (
+                callback_id not in self._owned_ids):
+            # Shared with a snapshot: copy it before the first change.
+            index = self._index[callback_id] = collections.defaultdict(
+                set, ((resource, set(resource_events))
+                      for resource, resource_events in index.items()))
+        else:
+            return index
+        if self._owned_ids is not None:
+            self._owned_ids.add(callback_id)
+        return index
+
+    def _get_purger(self, callback_id):
+        """Return a weakref callback dropping callback_id from the manager."""
+        # The manager is weakly referenced as well, so that subscriptions do
+        # not keep an otherwise unused manager alive.
+        manager_ref = weakref.ref(self)
+
+        def purge(ref):
+            manager = manager_ref()
+            if manager is None:
+                return
+            with manager._lock:
+                if callback_id in manager._index:
+                    LOG.debug("Callback %s collected, unsubscribing",
+                              callback_id)
+                    manager._remove(callback_id)
+        return purge
+
+    def _update_dispatch(self, resource, event):
+        """Rebuild the dispatch entries affected by a resource event.
+
+        Must be called with the lock held.
+        """
+        dispatch = dict(self._dispatch)
+        if _is_pattern(resource) or _is_pattern(event):
+            if self._callbacks[resource].get(event):
+                self._patterns = self._patterns | set([(resource, event)])
+            else:
+                self._patterns = self._patterns - set([(resource, event)])
+            keys = [(r, e) for r, e in dispatch
+                    if (fnmatch.fnmatchcase(r, resource) and
+                        fnmatch.fnmatchcase(e, event))]
+        else:
+            keys = [(resource, event)]
+        for key in keys:
+            callbacks = self._compile_dispatch(*key)
+            if callbacks:
+                dispatch[key] = callbacks
+            else:
+                dispatch.pop(key, None)
+        self._dispatch = dispatch
+
+    def _compile_dispatch(self, resource, event):
+        """Return the subscriptions matching a resource event."""
+        subscriptions = dict(self._callbacks.get(resource, {}).get(event, {}))
+        for resource_pattern, event_pattern in self._patterns:
+            if (fnmatch.fnmatchcase(resource, resource_pattern) and
+                    fnmatch.fnmatchcase(event, event_pattern)):
+                for callback_id, subscription in self._callbacks[
+                        resource_pattern][event_pattern].items():
+                    subscriptions.setdefault(callback_id, subscription)
+        return tuple(subscriptions.values())
+
+    def _get_callbacks(self, resource, event):
+        """Return the subscriptions to dispatch a resource event to."""
+        callbacks = self._dispatch.get((resource, event))
+        if callbacks is None and self._patterns:
+            # First notification of this resource event since the wildcard
+            # subscriptions changed: compile and cache its entry, even if
+            # empty, so that subsequent notifications do not match again.
+            with self._lock:
+                callbacks = self._compile_dispatch(resource, event)
+                dispatch = dict(self._dispatch)
+                dispatch[resource, event] = callbacks
+                self._dispatch = dispatch
+        return callbacks
 
     def _notify_loop(self, resource, event, trigger, **kwargs):
         """The notification loop."""
+        return self._notify_batch_loop(resource, event, trigger, [kwargs])
+
+    def _notify_batch_loop(self, resource, event, trigger, payloads):
+        """The notification loop for one or more payloads."""
+        callbacks = self._get_callbacks(resource, event)
+        if not callbacks:
+            return []
+
         LOG.debug("Notify callbacks for %(resource)s, %(event)s",
                   {'resource': resource, 'event': event})
 
+        calls = self._get_calls(resource, event, callbacks, payloads)
+        notify_callback = (self._notify_callback if self._stats is None
+                           else self._notify_callback_with_stats)
+
+        if (self._max_workers and len(calls) > 1 and
+                events.is_after(event)):
+            # AFTER_* events cannot be aborted, so the subscribers can run
+            # side by side; errors are still collected for every callback.
+            pile = eventlet.GreenPile(self._max_workers)
+            for subscription, kwargs in calls:
+                pile.spawn(notify_callback, subscription,
+                           resource, event, trigger, kwargs)
+            return [error for error in pile if error]
+
         errors = []
-        callbacks = self._callbacks[resource].get(event, {}).items()
-        # TODO(armax): consider using a GreenPile
-        for callback_id, callback in callbacks:
-            try:
-                LOG.debug("Calling callback %s", callback_id)
-                callback(resource, event, trigger, **kwargs)
-            except Exception as e:
-                LOG.exception(_LE("Error during notification for "
-                                  "%(callback)s %(resource)s, %(event)s"),
-                              {'callback': callback_id,
-                               'resource': resource,
-                               'event': event})
-                errors.append(exceptions.NotificationError(callback_id, e))
+        for subscription, kwargs in calls:
+            error = notify_callback(subscription,
+                                    resource, event, trigger, kwargs)
+            if error:
+                errors.append(error)
         return errors
 
+    def _get_calls(self, resource, event, callbacks, payloads):
+        """Return the (subscription, kwargs) pairs to call for payloads."""
+        calls = []
+        # The values of the key paths filtered on, per payload: each path
+        # is only looked up once, however many subscriptions filter on it.
+        values = None
+        for subscription in callbacks:
+            matching = payloads
+            if subscription.filters:
+                if values is None:
+                    values = [{} for _payload in payloads]
+                matching = [payload for payload, payload_values in
+                            zip(payloads, values)
+                            if _match_filters(subscription.filters,
+                                              payload, payload_values)]
+                if len(matching) < len(payloads):
+                    self._record_skipped(subscription, resource, event,
+                                         len(payloads) - len(matching))
+                    if not matching:
+                        continue
+            if subscription.batch:
+                calls.append((subscription, {'payloads': matching}))
+            else:
+                calls.extend((subscription, payload) for payload in matching)
+        return calls
+
+    def _record_skipped(self, subscription, resource, event, skipped):
+        key = (subscription.callback_id, resource, event)
+        try:
+            self._skipped[key][1] += skipped
+        except KeyError:
+            self._skipped[key] = [_get_name(subscription.callback), skipped]
+
+    def _notify_callback(self, subscription,
+                         resource, event, trigger, kwargs):
+        """Call a single callback, returning a NotificationError on failure."""
+        callback = subscription.callback
+        breaker = self._breakers.get(subscription.callback_id)
+        if breaker is not None and breaker.open_until:
+            if _now() < breaker.open_until:
+                breaker.skipped += 1
+                return exceptions.NotificationError(
+                    breaker.name, exceptions.CallbackSkipped(
+                        breaker.failures))
+        try:
+            LOG.debug("Calling callback %s", callback)
+            if subscription.timeout:
+                with eventlet.Timeout(subscription.timeout,
+                                      exceptions.CallbackTimeout(
+                                          subscription.timeout)):
+                    callback(resource, event, trigger, **kwargs)
+            else:
+                callback(resource, event, trigger, **kwargs)
+        except Exception as e:
+            callback_name = _get_name(callback)
+            LOG.exception(_LE("Error during notification for "
+                              "%(callback)s %(resource)s, %(event)s"),
+                          {'callback': callback_name,
+                           'resource': resource,
+                           'event': event})
+            if self._failure_threshold:
+                self._record_failure(subscription, callback_name)
+            return exceptions.NotificationError(callback_name, e)
+        if breaker is not None:
+            breaker.failures = 0
+            breaker.open_until = 0
+
+    def _record_failure(self, subscription, callback_name):
+        """Count a failure of a callback, skipping it past the threshold."""
+        try:
+            breaker = self._breakers[subscription.callback_id]
+        except KeyError:
+            breaker = self._breakers.setdefault(subscription.callback_id,
+                                                _Breaker(callback_name))
+        breaker.failures += 1
+        if breaker.failures >= self._failure_threshold:
+            breaker.open_until = _now() + self._failure_cooldown
+            breaker.trips += 1
+            LOG.warning(_LW("Callback %(callback)s failed %(failures)d "
+                            "times in a row, skipping it for %(cooldown)s "
+                            "seconds"),
+                        {'callback': callback_name,
+                         'failures': breaker.failures,
+                         'cooldown': self._failure_cooldown})
+
+    def _notify_callback_with_stats(self, subscription,
+                                    resource, event, trigger, kwargs):
+        """Call a single callback, recording its latency and outcome."""
+        start = _now()
+        error = self._notify_callback(subscription,
+                                      resource, event, trigger, kwargs)
+        elapsed = _now() - start
+        all_stats = self._stats
+        if all_stats is None:
+            # Stats were disabled while the callback was running.
+            return error
+        key = (subscription.callback_id, resource, event)
+        try:
+            stats = all_stats[key]
+        except KeyError:
+            stats = all_stats[key] = _CallbackStats(
+                _get_name(subscription.callback))
+        stats.record(elapsed, error is not None)
+        return error
+
     def _find(self, callback):
         """Return the callback_id if found, None otherwise."""
         callback_id = _get_id(callback)
@@ -155,8 +749,180 @@ class CallbacksManager(object):
 
 
 def _get_id(callback):
-    """Return a unique identifier for the callback."""
-    # TODO(armax): consider using something other than names
-    # https://www.python.org/dev/peps/pep-3155/, but this
-    # might be okay for now.
+    """Return a unique identifier for the callback.
+
+    Bound methods are identified by the instance they are bound to and by
+    their underlying function, so that the same method bound to different
+    instances never collides; any other callable by its own id. Either way,
+    the identifier hashes in constant time without any introspection, and
+    holds no reference to the object a weak subscription must not keep
+    alive: its entries are purged on collection, before the id is reused.
+    """
+    try:
+        return id(callback.__self__), callback.__func__
+    except AttributeError:
+        return id(callback), None
+
+
+def _is_pattern(name):
+    """Return True if a resource or event name is a wildcard pattern."""
+    return '*' in name or '?' in name or '[' in name
+
+
+def _get_object_id(resource):
+    """Return a callable fetching the id of the resource from kwargs."""
+    def get_object_id(kwargs):
+        payload = kwargs.get('payload')
+        if isinstance(payload, events.EventPayload):
+            return payload.resource_id
+        return kwargs[resource]['id']
+    return get_object_id
+
+
+def _get_name(callback):
+    """Return the human readable name of the callback, for messages only."""
+    if isinstance(callback, _WeakCallback):
+        callback = callback.resolve()
     return reflection.get_callable_name(callback)
+
+
+_Subscription = collections.namedtuple(
+    '_Subscription',
+    ['callback_id', 'callback', 'batch', 'filters', 'timeout'])
+
+_Snapshot = collections.namedtuple(
+    '_Snapshot', ['callbacks', 'index', 'dispatch', 'patterns', 'coalesce'])
+
+_MISSING = object()
+
+
+def _compile_filters(filters):
+    """Return the filters of a subscription as (path, values) pairs."""
+    if not filters:
+        return ()
+    compiled = []
+    for path, values in sorted(filters.items()):
+        if isinstance(values, six.string_types):
+            values = [values]
+        compiled.append((tuple(path.split('.')), frozenset(values)))
+    return tuple(compiled)
+
+
+def _match_filters(filters, payload, values):
+    """Return True if a payload matches every filter of a subscription.
+
+    :param values: a cache of the values found in the payload, by path.
+    """
+    for path, allowed in filters:
+        try:
+            value = values[path]
+        except KeyError:
+            value = values[path] = _get_path(payload, path)
+        try:
+            if value not in allowed:
+                return False
+        except TypeError:
+            # Unhashable, thus not one of the allowed values.
+            return False
+    return True
+
+
+def _get_path(payload, path):
+    """Return the value of a key path in a payload, _MISSING if absent."""
+    value = payload
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            value = getattr(value, key, _MISSING)
+        if value is _MISSING:
+            break
+    return value
+
+
+class _CallbackStats(object):
+    """Call counts and latencies of a callback for a resource event."""
+
+    __slots__ = ('name', 'calls', 'errors', 'total_time', 'max_time',
+                 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, elapsed, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        bucket = int(elapsed * 1000000).bit_length()
+        self.histogram[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+
+    def to_dict(self, resource, event):
+        histogram = {}
+        for bucket, count in enumerate(self.histogram):
+            if count:
+                upper_bound = (2 ** bucket
+                               if bucket < HISTOGRAM_BUCKETS - 1 else None)
+                histogram[upper_bound] = count
+        return {'callback': self.name,
+                'resource': resource,
+                'event': event,
+                'calls': self.calls,
+                'errors': self.errors,
+                'total_time': self.total_time,
+                'max_time': self.max_time,
+                'histogram': histogram}
+
+
+class _Breaker(object):
+    """The consecutive failures of a callback and whether it is skipped."""
+
+    __slots__ = ('name', 'failures', 'open_until', 'trips', 'skipped')
+
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.open_until = 0
+        self.trips = 0
+        self.skipped = 0
+
+
+class _WeakCallback(object):
+    """A callable weakly referencing a subscribed callback.
+
+    Bound methods are split into a weak reference to their instance and the
+    underlying function, as a reference to the bound method itself would die
+    immediately.
+    """
+
+    __slots__ = ('_ref', '_func')
+
+    def __init__(self, callback, on_collected):
+        try:
+            obj, self._func = callback.__self__, callback.__func__
+        except AttributeError:
+            obj, self._func = callback, None
+        self._ref = weakref.ref(obj, on_collected)
+
+    def __call__(self, *args, **kwargs):
+        obj = self._ref()
+        if obj is None:
+            # Collected, the subscription is being purged.
+            return
+        if self._func is None:
+            return obj(*args, **kwargs)
+        return self._func(obj, *args, **kwargs)
+
+    def resolve(self):
+        """Return the referenced callback, or None if it was collected."""
+        obj = self._ref()
+        if obj is None or self._func is None:
+            return obj
+        return types.MethodType(self._func, obj)
@@ -10,22 +10,29 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 from neutron_lib.callbacks import manager
 
 
-# TODO(armax): consider adding locking
 CALLBACK_MANAGER = None
+_CALLBACK_MANAGER_LOCK = threading.Lock()
 
 
 def _get_callback_manager():
     global CALLBACK_MANAGER
     if CALLBACK_MANAGER is None:
-        CALLBACK_MANAGER = manager.CallbacksManager()
+        with _CALLBACK_MANAGER_LOCK:
+            if CALLBACK_MANAGER is None:
+                CALLBACK_MANAGER = manager.CallbacksManager()
     return CALLBACK_MANAGER
 
 
-def subscribe(callback, resource, event):
-    _get_callback_manager().subscribe(callback, resource, event)
+def subscribe(callback, resource, event, weak=False, batch=False,
+              filters=None, timeout=None):
+    _get_callback_manager().subscribe(callback, resource, event,
+                                      weak=weak, batch=batch, filters=filters,
+                                      timeout=timeout)
 
 
 def unsubscribe(callback, resource, event):
@@ -44,5 +51,38 @@ def notify(resource, event, trigger, **kwargs):
     _get_callback_manager().notify(resource, event, trigger, **kwargs)
 
 
+def publish(resource, event, trigger, payload=None):
+    _get_callback_manager().publish(resource, event, trigger, payload=payload)
+
+
+def notify_many(resource, event, trigger, payloads):
+    _get_callback_manager().notify_many(resource, event, trigger, payloads)
+
+
+def async_notify(resource, event, trigger, **kwargs):
+    """Return an awaitable notifying the registry subscribers.
+
+    Coroutine callbacks are awaited concurrently, plain callbacks are run in
+    the event loop's default executor. Requires Python 3.5 or later.
+    """
+    # NOTE: imported here as the module relies on native coroutine syntax.
+    from neutron_lib.callbacks import async_manager
+    return async_manager.AsyncCallbacksManager(
+        _get_callback_manager()).notify(resource, event, trigger, **kwargs)
+
+
+def coalesce(resource, event, window, get_object_id=None):
+    _get_callback_manager().coalesce(resource, event, window,
+                                     get_object_id=get_object_id)
+
+
+def get_stats():
+    return _get_callback_manager().get_stats()
+
+
+def get_breaker_stats():
+    return _get_callback_manager().get_breaker_stats()
+
+
 def clear():
     _get_callback_manager().clear()
@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import six
+
 # String literals representing core resources.
 PORT = 'port'
 PROCESS = 'process'
@@ -20,3 +22,36 @@ SECURITY_GROUP = 'security_group'
 SECURITY_GROUP_RULE = 'security_group_rule'
 SUBNET = 'subnet'
 SUBNET_GATEWAY = 'subnet_gateway'
+
+# The registered resources, mapping their name to their interned identifier.
+_RESOURCES = {}
+
+
+def register(resource):
+    """Register a resource.
+
+    :param resource: the resource name.
+    :returns: the interned identifier of the resource, equal to its name.
+    """
+    try:
+        return _RESOURCES[resource]
+    except KeyError:
+        pass
+    try:
+        interned = six.moves.intern(resource)
+    except TypeError:
+        # Only str can be interned on Python 2.
+        interned = resource
+    _RESOURCES[interned] = interned
+    return interned
+
+
+def get_resources():
+    """Return the names of the registered resources."""
+    return frozenset(_RESOURCES)
+
+
+for _resource in (PORT, PROCESS, ROUTER, ROUTER_GATEWAY, ROUTER_INTERFACE,
+                  SECURITY_GROUP, SECURITY_GROUP_RULE, SUBNET,
+                  SUBNET_GATEWAY):
+    register(_resource)
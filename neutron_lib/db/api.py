@@ -13,28 +13,165 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import contextlib
+import itertools
+import random
+import time
 
 from oslo_config import cfg
-from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
 from oslo_db.sqlalchemy import session
+from oslo_log import log as logging
+from oslo_utils import reflection
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
+import six
+from sqlalchemy import event as sa_event
 from sqlalchemy import exc
+from sqlalchemy import orm
+from sqlalchemy.orm import attributes
 
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions as cb_exc
+from neutron_lib.callbacks import registry
 from neutron_lib.common import exceptions as n_exc
 from neutron_lib.db import common_db_mixin
+from neutron_lib.db import sqlalchemyutils
+from neutron_lib.i18n import _LW
 
+LOG = logging.getLogger(__name__)
 
 _FACADE = None
 
+# The row classes of the compact results, by model class.
+_ROW_CLASSES = {}
+
+# Keys of Session.info holding the notifications deferred until commit.
+_PENDING_NOTIFICATIONS = 'neutron_lib.pending_notifications'
+_COMMITTED = 'neutron_lib.committed'
+
+# Keys of Session.info holding whether the current transaction of the
+# session wrote, the time its last write was committed and its replica
+# session, for read routing.
+_WRITTEN = 'neutron_lib.written'
+_LAST_WRITE = 'neutron_lib.last_write'
+_READER_SESSION = 'neutron_lib.reader_session'
+
+# None when read routing is disabled, otherwise the time, in seconds, a
+# context reads from the primary database after it wrote to it.
+_READ_PIN_TIME = None
+
 MAX_RETRIES = 10
+READ_PIN_TIME = 10
+RETRY_INTERVAL = 0.1
+MAX_RETRY_INTERVAL = 5
+RETRY_TIME_BUDGET = 60
+ITER_BATCH_SIZE = 500
 is_deadlock = lambda e: isinstance(e, db_exc.DBDeadlock)
-retry_db_errors = oslo_db_api.wrap_db_retry(
-    max_retries=MAX_RETRIES,
-    retry_on_request=True,
-    exception_checker=is_deadlock
-)
+
+# The retry counters, by name of the decorated function.
+_RETRY_STATS = {}
+
+
+def wrap_db_retry(max_retries=MAX_RETRIES, retry_interval=RETRY_INTERVAL,
+                  max_retry_interval=MAX_RETRY_INTERVAL,
+                  time_budget=RETRY_TIME_BUDGET, exception_checker=None,
+                  retry_on_connection_error=False, retry_on_duplicate=False):
+    """Return a decorator retrying a function on transient DB errors.
+
+    The function is retried on deadlocks and on RetryRequest, whose inner
+    exception is raised once the retries are exhausted. Between attempts,
+    it sleeps for a random time between 0 and an exponentially growing
+    interval (full jitter), so that the workers that collided do not all
+    retry at once. The retry and error counters of every decorated function
+    are reported by get_retry_stats.
+
+    :param max_retries: the maximum number of retries.
+    :param retry_interval: the upper bound of the first sleep, in seconds;
+        it doubles at every retry.
+    :param max_retry_interval: the maximum upper bound of a sleep.
+    :param time_budget: the time, in seconds, after which the function is
+        not retried anymore, however many retries are left.
+    :param exception_checker: a callable returning True for any other
+        exception to retry on.
+    :param retry_on_connection_error: whether to retry on DBConnectionError.
+        Only safe for functions that can be replayed after the connection
+        was lost at any point, including during a commit.
+    :param retry_on_duplicate: whether to retry on DBDuplicateEntry, e.g.
+        for functions that look an object up and create it if missing.
+    """
+    def get_reason(e):
+        if isinstance(e, db_exc.DBDeadlock):
+            return 'deadlocks'
+        if isinstance(e, db_exc.RetryRequest):
+            return 'retry_requests'
+        if retry_on_connection_error and isinstance(
+                e, db_exc.DBConnectionError):
+            return 'connection_errors'
+        if retry_on_duplicate and isinstance(e, db_exc.DBDuplicateEntry):
+            return 'duplicates'
+        if exception_checker is not None and exception_checker(e):
+            return 'other_errors'
+
+    def decorator(f):
+        stats = _RETRY_STATS.setdefault(
+            reflection.get_callable_name(f),
+            dict.fromkeys(['calls', 'retries', 'exhausted', 'deadlocks',
+                           'retry_requests', 'connection_errors',
+                           'duplicates', 'other_errors'], 0))
+
+        @six.wraps(f)
+        def wrapper(*args, **kwargs):
+            stats['calls'] += 1
+            watch = timeutils.StopWatch().start()
+            retries = 0
+            while True:
+                try:
+                    return f(*args, **kwargs)
+                except Exception as e:
+                    reason = get_reason(e)
+                    if reason is None:
+                        raise
+                    stats[reason] += 1
+                    delay = random.uniform(0, min(
+                        max_retry_interval, retry_interval * 2 ** retries))
+                    if (retries >= max_retries or
+                            watch.elapsed() + delay > time_budget):
+                        stats['exhausted'] += 1
+                        LOG.warning(_LW("%(function)s failed after "
+                                        "%(retries)d retries in %(time).1f "
+                                        "seconds"),
+                                    {'function': f.__name__,
+                                     'retries': retries,
+                                     'time': watch.elapsed()})
+                        if isinstance(e, db_exc.RetryRequest):
+                            raise e.inner_exc
+                        raise
+                    retries += 1
+                    stats['retries'] += 1
+                    LOG.debug("Retrying %(function)s in %(delay).3f seconds "
+                              "after %(error)s",
+                              {'function': f.__name__, 'delay': delay,
+                               'error': e})
+                    time.sleep(delay)
+        return wrapper
+    return decorator
+
+
+def get_retry_stats():
+    """Return the retry counters of the functions decorated for retries.
+
+    :returns: a dict mapping the name of every decorated function to a dict
+        with the number of 'calls', of 'retries', of calls which 'exhausted'
+        their retries, and of the errors retried on, by kind: 'deadlocks',
+        'retry_requests', 'connection_errors', 'duplicates' and
+        'other_errors'.
+    """
+    return dict((name, dict(stats)) for name, stats in _RETRY_STATS.items())
+
+
+retry_db_errors = wrap_db_retry(max_retries=MAX_RETRIES)
 
 
 def _create_facade_lazily():
@@ -66,6 +203,84 @@ def get_session(autocommit=True, expire_on_commit=False, use_slave=False):
                               use_slave=use_slave)
 
 
+def set_read_routing(enabled, pin_time=READ_PIN_TIME):
+    """Route the queries of the read-only helpers to a replica database.
+
+    When enabled, get_object, get_objects, get_rows, iter_objects and the
+    collections of CommonDbMixin query the replica database configured as
+    the slave_connection of the database options (or the primary one if
+    there is none), unless a transaction is active in the session of the
+    context, or the context committed a write to the primary database less
+    than pin_time seconds ago: a context always reads its own writes.
+
+    The objects read from the replica belong to a session of their own,
+    they must not be modified nor added to the session of the context.
+
+    :param enabled: whether to route the reads.
+    :param pin_time: the time, in seconds, a context keeps reading from the
+        primary database after it wrote to it. It should exceed the
+        replication lag.
+    """
+    global _READ_PIN_TIME
+    if enabled and not sa_event.contains(orm.Session, 'after_flush',
+                                         _on_flush):
+        sa_event.listen(orm.Session, 'after_flush', _on_flush)
+        sa_event.listen(orm.Session, 'after_commit', _on_write_commit)
+        sa_event.listen(orm.Session, 'after_transaction_end',
+                        _on_write_transaction_end)
+    _READ_PIN_TIME = pin_time if enabled else None
+
+
+def get_reader_session(context):
+    """Return the session the read-only queries of a context run in.
+
+    :param context: the context.
+    :returns: the session of the context, or a session of the replica
+        database if read routing is enabled and the context can read from
+        it; see set_read_routing.
+    """
+    sess = context.session
+    if _READ_PIN_TIME is None or sess.transaction is not None:
+        return sess
+    last_write = sess.info.get(_LAST_WRITE)
+    if last_write is not None and timeutils.now() - last_write < (
+            _READ_PIN_TIME):
+        return sess
+    reader = sess.info.get(_READER_SESSION)
+    if reader is None:
+        reader = sess.info[_READER_SESSION] = get_session(use_slave=True)
+    return reader
+
+
+def _on_flush(sess, flush_context):
+    _mark_write(sess)
+
+
+def _mark_write(sess):
+    """Pin the context of a session to the primary database.
+
+    The pin time runs from the commit of the outermost transaction, as the
+    writes only reach the replicas then.
+    """
+    if _READ_PIN_TIME is None:
+        return
+    if sess.transaction is None:
+        sess.info[_LAST_WRITE] = timeutils.now()
+    else:
+        sess.info[_WRITTEN] = True
+
+
+def _on_write_commit(sess):
+    if sess.transaction._parent is None and sess.info.pop(_WRITTEN, False):
+        sess.info[_LAST_WRITE] = timeutils.now()
+
+
+def _on_write_transaction_end(sess, transaction):
+    if transaction._parent is None:
+        # Rolled back, or committed and already accounted for.
+        sess.info.pop(_WRITTEN, None)
+
+
 @contextlib.contextmanager
 def autonested_transaction(sess):
     """This is a convenience method to not bother with 'nested' parameter."""
@@ -78,28 +293,178 @@ def autonested_transaction(sess):
             yield tx
 
 
+def notify_after_commit(context, resource, event, trigger, **kwargs):
+    """Notify an AFTER_* event once the session of a context commits.
+
+    When called inside a transaction, the notification is queued on the
+    session and dispatched through the registry only after the outermost
+    transaction commits, so that the callbacks do not run while the row
+    locks of the transaction are held. It is dropped if the work it
+    belongs to is rolled back, either by a rollback of the outermost
+    transaction or of the enclosing savepoint. Outside of a transaction,
+    the notification is dispatched right away.
+
+    :param context: the context holding the session.
+    :param resource: the resource.
+    :param event: the event. It must be an AFTER_* event.
+    :param trigger: the trigger. A reference to the sender of the event.
+    """
+    if not events.is_after(event):
+        raise cb_exc.Invalid(element='event', value=event)
+    sess = context.session
+    if sess.transaction is None:
+        registry.notify(resource, event, trigger, **kwargs)
+        return
+    if not sa_event.contains(sess, 'after_transaction_end',
+                             _on_transaction_end):
+        sa_event.listen(sess, 'after_commit', _on_commit)
+        sa_event.listen(sess, 'after_soft_rollback', _on_soft_rollback)
+        sa_event.listen(sess, 'after_transaction_end', _on_transaction_end)
+    sess.info.setdefault(_PENDING_NOTIFICATIONS, []).append(
+        (sess.transaction, (resource, event, trigger, kwargs)))
+
+
+# NOTE: SessionTransaction.parent is only available as of SQLAlchemy
+# 1.0.16, _parent is used for previous versions.
+def _on_commit(sess):
+    # Savepoints commit too, only the outermost transaction makes the
+    # deferred notifications final.
+    if sess.transaction._parent is None:
+        sess.info[_COMMITTED] = True
+
+
+def _on_soft_rollback(sess, previous_transaction):
+    pending = sess.info.get(_PENDING_NOTIFICATIONS)
+    if not pending:
+        return
+    # The work is rolled back up to the enclosing savepoint, or to the
+    # outermost transaction.
+    rolled_back = previous_transaction
+    while not rolled_back.nested and rolled_back._parent is not None:
+        rolled_back = rolled_back._parent
+    sess.info[_PENDING_NOTIFICATIONS] = [
+        (transaction, notification) for transaction, notification in pending
+        if not _is_within(transaction, rolled_back)]
+
+
+def _on_transaction_end(sess, transaction):
+    if transaction._parent is not None:
+        return
+    pending = sess.info.pop(_PENDING_NOTIFICATIONS, [])
+    if not sess.info.pop(_COMMITTED, False):
+        return
+    for _transaction, (resource, event, trigger, kwargs) in pending:
+        registry.notify(resource, event, trigger, **kwargs)
+
+
+def _is_within(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction._parent
+    return False
+
+
 # Common database operation implementations
 def get_object(context, model, **kwargs):
-    with context.session.begin(subtransactions=True):
-        return (common_db_mixin.model_query(context, model)
+    sess = get_reader_session(context)
+    with sess.begin(subtransactions=True):
+        return (common_db_mixin.model_query(context, model, session=sess)
                 .filter_by(**kwargs)
                 .first())
 
 
 def get_objects(context, model, **kwargs):
-    with context.session.begin(subtransactions=True):
-        return (common_db_mixin.model_query(context, model)
+    sess = get_reader_session(context)
+    with sess.begin(subtransactions=True):
+        return (common_db_mixin.model_query(context, model, session=sess)
                 .filter_by(**kwargs)
                 .all())
 
 
-def create_object(context, model, values):
+def get_rows(context, model, fields=None, **kwargs):
+    """Return the column values of the objects of a model.
+
+    Only the columns are queried: no model object is created nor added to
+    the session, which makes it much cheaper than get_objects for read only
+    use.
+
+    :param context: the context.
+    :param model: the model class.
+    :param fields: the names of the columns to return, all the mapped
+        columns by default.
+    :returns: a list of named tuples, one per object matching the filters.
+    """
+    columns = [getattr(model, field)
+               for field in fields or _get_row_class(model)._fields]
+    sess = get_reader_session(context)
+    with sess.begin(subtransactions=True):
+        return (common_db_mixin.model_query(context, model, session=sess)
+                .filter_by(**kwargs)
+                .with_entities(*columns)
+                .all())
+
+
+def iter_objects(context, model, batch_size=ITER_BATCH_SIZE, **kwargs):
+    """Iterate over the objects of a model, loading them in batches.
+
+    Unlike get_objects, at most batch_size objects are loaded at a time, so
+    that memory stays bounded however many objects match: the objects are
+    fetched in primary key order, one query per batch, and each batch is
+    expunged from the session before the next one is loaded. The objects
+    that were already in the session are left in it.
+
+    Expunged objects are detached: their attributes not loaded by the query
+    cannot be lazy loaded anymore and their changes are not persisted.
+
+    :param context: the context.
+    :param model: the model class.
+    :param batch_size: the number of objects loaded per query.
+    :returns: an iterator of the objects matching the filters.
+    """
+    # Keyset pagination: every batch starts after the last object of the
+    # previous one, so that the cost of a batch does not depend on its
+    # position and no cursor is kept open while the objects are processed.
+    sorts = [(key, True)
+             for key in model.__table__.primary_key.columns.keys()]
+    sess = get_reader_session(context)
+    query = (common_db_mixin.model_query(context, model, session=sess)
+             .filter_by(**kwargs))
+    existing = set(sess.identity_map.keys())
+    marker = None
+    while True:
+        with sess.begin(subtransactions=True):
+            batch = sqlalchemyutils.paginate_query(
+                query, model, batch_size, sorts, marker_obj=marker).all()
+        for db_obj in batch:
+            yield db_obj
+        for db_obj in batch:
+            if (db_obj in sess and
+                    attributes.instance_state(db_obj).key not in existing):
+                sess.expunge(db_obj)
+        if len(batch) < batch_size:
+            return
+        marker = batch[-1]
+
+
+def create_object(context, model, values, compact=False):
+    """Create an object of a model.
+
+    :param context: the context.
+    :param model: the model class.
+    :param values: a dict of column values; an 'id' is generated if there
+        is none.
+    :param compact: whether to return a slotted row of the mapped columns,
+        holding no reference to the object nor to the session, instead of
+        the dict of the object.
+    :returns: the columns of the object.
+    """
     with context.session.begin(subtransactions=True):
         if 'id' not in values:
             values['id'] = uuidutils.generate_uuid()
         db_obj = model(**values)
         context.session.add(db_obj)
-    return db_obj.__dict__
+    return _to_row(db_obj) if compact else db_obj.__dict__
 
 
 def _safe_get_object(context, model, id):
@@ -109,15 +474,230 @@ def _safe_get_object(context, model, id):
     return db_obj
 
 
-def update_object(context, model, id, values):
+def update_object(context, model, id, values, load=True, compact=False):
+    """Update an object of a model.
+
+    :param context: the context.
+    :param model: the model class.
+    :param id: the id of the object.
+    :param values: a dict of the column values to set.
+    :param load: whether to load the object before updating it. If False,
+        a single UPDATE statement scoped by model_query is issued instead,
+        and only the updated columns are returned.
+    :param compact: whether to return a slotted row of the mapped columns,
+        as create_object does, instead of the dict of the object. Ignored if
+        load is False.
+    :raises ObjectNotFound: if there is no such object in scope.
+    :returns: the columns of the object, or a dict of those updated if load
+        is False.
+    """
+    if not load:
+        if update_objects(context, model, [id], values):
+            raise n_exc.ObjectNotFound(id=id)
+        return dict(values, id=id)
     with context.session.begin(subtransactions=True):
         db_obj = _safe_get_object(context, model, id)
         db_obj.update(values)
         db_obj.save(session=context.session)
-    return db_obj.__dict__
+    return _to_row(db_obj) if compact else db_obj.__dict__
 
 
-def delete_object(context, model, id):
+def delete_object(context, model, id, load=True):
+    """Delete an object of a model.
+
+    :param context: the context.
+    :param model: the model class.
+    :param id: the id of the object.
+    :param load: whether to load the object before deleting it. If False,
+        a single DELETE statement scoped by model_query is issued instead,
+        so that the ORM cascades are not applied, only those of the database
+        foreign keys.
+    :raises ObjectNotFound: if there is no such object in scope.
+    """
+    if not load:
+        with context.session.begin(subtransactions=True):
+            deleted = (common_db_mixin.model_query(context, model)
+                       .filter(model.id == id)
+                       .delete(synchronize_session=False))
+            _mark_write(context.session)
+        if not deleted:
+            raise n_exc.ObjectNotFound(id=id)
+        _sync_session(context.session, model, set([id]),
+                      context.session.expunge)
+        return
     with context.session.begin(subtransactions=True):
         db_obj = _safe_get_object(context, model, id)
         context.session.delete(db_obj)
+
+
+def create_objects(context, model, values_list):
+    """Create many objects of a model with a single bulk INSERT.
+
+    The rows are inserted into the table of the model with an executemany
+    INSERT: no model object is created, so that ORM events are not fired and
+    relationships cannot be set, and the column defaults computed by the
+    database are not returned. Consecutive dicts with different keys are
+    inserted by separate statements.
+
+    :param context: the context.
+    :param model: the model class.
+    :param values_list: a list of dicts of values keyed by column name, one
+        per object; an 'id' is generated for those that have none.
+    :returns: the list of values, including the generated ids.
+    """
+    with context.session.begin(subtransactions=True):
+        for values in values_list:
+            if 'id' not in values:
+                values['id'] = uuidutils.generate_uuid()
+        # NOTE: Session.bulk_insert_mappings is only available from
+        # SQLAlchemy 1.0.
+        insert = model.__table__.insert()
+        for _keys, group in itertools.groupby(values_list, key=sorted):
+            context.session.execute(insert, list(group))
+        if values_list:
+            _mark_write(context.session)
+    return values_list
+
+
+def update_objects(context, model, ids, values):
+    """Update many objects of a model with a single UPDATE statement.
+
+    The objects are updated in the database directly, without being loaded,
+    within the tenant scoping of model_query; the ids not found are only
+    looked up when fewer rows than ids matched. The copies of the objects
+    already loaded in the session are expired.
+
+    :param context: the context.
+    :param model: the model class.
+    :param ids: the ids of the objects to update.
+    :param values: a dict of the column values to set.
+    :returns: the ids that were not found, in the order they were given.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    unique_ids = set(ids)
+    missing = []
+    with context.session.begin(subtransactions=True):
+        matched = (common_db_mixin.model_query(context, model)
+                   .filter(model.id.in_(unique_ids))
+                   .update(values, synchronize_session=False))
+        _mark_write(context.session)
+        if matched < len(unique_ids):
+            found = _find_ids(context, model, unique_ids)
+            missing = [id for id in ids if id not in found]
+    _sync_session(context.session, model, unique_ids,
+                  context.session.expire)
+    return missing
+
+
+def delete_objects(context, model, ids):
+    """Delete many objects of a model with a single DELETE statement.
+
+    The ids in the tenant scoping of model_query are selected first, to
+    report the missing ones, then the objects are deleted in the database
+    directly, without being loaded: the ORM cascades are not applied, only
+    those of the database foreign keys. The copies of the objects already
+    loaded in the session are expunged.
+
+    :param context: the context.
+    :param model: the model class.
+    :param ids: the ids of the objects to delete.
+    :returns: the ids that were not found, in the order they were given.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    with context.session.begin(subtransactions=True):
+        found = _find_ids(context, model, set(ids))
+        if found:
+            (common_db_mixin.model_query(context, model)
+             .filter(model.id.in_(found))
+             .delete(synchronize_session=False))
+            _mark_write(context.session)
+    _sync_session(context.session, model, found, context.session.expunge)
+    return [id for id in ids if id not in found]
+
+
+def _find_ids(context, model, ids):
+    """Return the ids, among those given, of the objects in scope."""
+    return set(row.id for row in (
+        common_db_mixin.model_query(context, model)
+        .filter(model.id.in_(ids))
+        .with_entities(model.id)))
+
+
+def _sync_session(sess, model, ids, sync):
+    """Apply sync to the objects of the session with the given ids."""
+    for db_obj in list(sess.identity_map.values()):
+        # Read the id from the identity of the object, as reading the
+        # attribute of an expired object would load it again.
+        if (isinstance(db_obj, model) and
+                attributes.instance_state(db_obj).identity[0] in ids):
+            sync(db_obj)
+
+
+class _Row(object):
+    """A read-only row of column values, accessed by name or position.
+
+    Unlike a named tuple, it accepts the column attributes whose name
+    starts with an underscore.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self._fields, values):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Can't set attribute %s of %s" %
+                             (name, type(self).__name__))
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (field, getattr(self, field)) for field in self._fields))
+
+    def _asdict(self):
+        return collections.OrderedDict(zip(self._fields, self))
+
+
+def _get_row_class(model):
+    """Return the row class of the mapped columns of a model."""
+    try:
+        return _ROW_CLASSES[model]
+    except KeyError:
+        fields = tuple(prop.key
+                       for prop in orm.class_mapper(model).column_attrs)
+        row_class = _ROW_CLASSES[model] = type(
+            str('%sRow' % model.__name__), (_Row,),
+            {'__slots__': fields, '_fields': fields})
+        return row_class
+
+
+def _to_row(db_obj):
+    """Return the row of the mapped columns of an object."""
+    row_class = _get_row_class(type(db_obj))
+    # Read the loaded values only, as __dict__ does: reading the attributes
+    # could emit a query.
+    values = attributes.instance_state(db_obj).dict
+    return row_class(*[values.get(field) for field in row_class._fields])
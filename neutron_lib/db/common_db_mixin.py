@@ -31,8 +31,8 @@ def model_query_scope(context, model):
             (not context.is_advsvc and hasattr(model, 'tenant_id')))
 
 
-def model_query(context, model):
-    query = context.session.query(model)
+def model_query(context, model, session=None):
+    query = (context.session if session is None else session).query(model)
     # define basic filter condition for model query
     query_filter = None
     if model_query_scope(context, model):
@@ -95,13 +95,13 @@ class CommonDbMixin(object):
     def model_query_scope(self, context, model):
         return model_query_scope(context, model)
 
-    def _model_query(self, context, model):
+    def _model_query(self, context, model, session=None):
         if isinstance(model, UnionModel):
-            return self._union_model_query(context, model)
+            return self._union_model_query(context, model, session=session)
         else:
-            return self._single_model_query(context, model)
+            return self._single_model_query(context, model, session=session)
 
-    def _union_model_query(self, context, model):
+    def _union_model_query(self, context, model, session=None):
         # A union query is a query that combines multiple sets of data
         # together and represents them as one. So if a UnionModel was
         # passed in, we generate the query for each model with the
@@ -111,7 +111,8 @@ class CommonDbMixin(object):
         first_query = None
         remaining_queries = []
         for name, component_model in model.model_map.items():
-            query = self._single_model_query(context, component_model)
+            query = self._single_model_query(context, component_model,
+                                             session=session)
             if model.column_type_name:
                 query.add_columns(
                     sql.expression.column('"%s"' % name, is_literal=True).
@@ -123,8 +124,8 @@ class CommonDbMixin(object):
                 remaining_queries.append(query)
         return first_query.union(*remaining_queries)
 
-    def _single_model_query(self, context, model):
-        query = context.session.query(model)
+    def _single_model_query(self, context, model, session=None):
+        query = (context.session if session is None else session).query(model)
         # define basic filter condition for model query
         query_filter = None
         if self.model_query_scope(context, model):
@@ -253,8 +254,8 @@ class CommonDbMixin(object):
 
     def _get_collection_query(self, context, model, filters=None,
                               sorts=None, limit=None, marker_obj=None,
-                              page_reverse=False):
-        collection = self._model_query(context, model)
+                              page_reverse=False, session=None):
+        collection = self._model_query(context, model, session=session)
         collection = self._apply_filters_to_query(collection, model, filters,
                                                   context)
         if limit and page_reverse and sorts:
@@ -271,14 +272,18 @@ class CommonDbMixin(object):
                                            sorts=sorts,
                                            limit=limit,
                                            marker_obj=marker_obj,
-                                           page_reverse=page_reverse)
+                                           page_reverse=page_reverse,
+                                           session=_get_reader_session(
+                                               context))
         items = [dict_func(c, fields) for c in query]
         if limit and page_reverse:
             items.reverse()
         return items
 
     def _get_collection_count(self, context, model, filters=None):
-        return self._get_collection_query(context, model, filters).count()
+        return self._get_collection_query(
+            context, model, filters,
+            session=_get_reader_session(context)).count()
 
     def _get_marker_obj(self, context, resource, limit, marker):
         if limit and marker:
@@ -294,6 +299,12 @@ class CommonDbMixin(object):
                     six.iteritems(data) if k in columns)
 
 
+def _get_reader_session(context):
+    # NOTE: imported here as the db api module depends on this one.
+    from neutron_lib.db import api as db_api
+    return db_api.get_reader_session(context)
+
+
 class UnionModel(object):
     """Collection of models that _model_query can query as a single table."""
 
@@ -34,11 +34,11 @@ import testtools
 
 # PCM: Must resolve these!
 from neutron.api.rpc.callbacks.consumer import registry as rpc_consumer_reg
-from neutron_lib.callbacks import manager as registry_manager
 from neutron.tests import fake_notifier
 from neutron.tests import post_mortem_debug
 from neutron.tests import tools
 
+from neutron_lib.callbacks import registry
 from neutron_lib.common import config
 from neutron_lib.common import constants
 from neutron_lib.common import rpc as n_rpc
@@ -102,6 +102,26 @@ def sanitize_log_path(path):
     # Sanitize the string so that its log path is shell friendly
     return path.replace(' ', '-').replace('(', '_').replace(')', '_')
 
+
+class CallbacksManagerFixture(fixtures.Fixture):
+    """Restore the subscriptions of a callbacks manager after a test.
+
+    Subscriptions made when importing modules are kept, while those made by
+    the test are dropped on cleanup, without rebuilding the manager.
+    """
+
+    def __init__(self, callbacks_manager=None):
+        super(CallbacksManagerFixture, self).__init__()
+        self.callbacks_manager = callbacks_manager
+
+    def setUp(self):
+        super(CallbacksManagerFixture, self).setUp()
+        if self.callbacks_manager is None:
+            self.callbacks_manager = registry._get_callback_manager()
+        self.addCleanup(self.callbacks_manager.restore,
+                        self.callbacks_manager.snapshot())
+
+
 # PCM Needed?
 class AttributeDict(dict):
 
@@ -334,10 +354,13 @@ class BaseTestCase(DietTestCase):
         n_rpc.init(CONF)
 
     def setup_test_registry_instance(self):
-        """Give a private copy of the registry to each test."""
-        self._callback_manager = registry_manager.CallbacksManager()
-        mock.patch.object(registry, '_get_callback_manager',
-                          return_value=self._callback_manager).start()
+        """Isolate the registry subscriptions of each test.
+
+        Tests start with the subscriptions of the registry, which are
+        restored once the test is done.
+        """
+        self._callback_manager = self.useFixture(
+            CallbacksManagerFixture()).callbacks_manager
 
     def setup_config(self, args=None):
         """Tests that need a non-default config can override this method."""
@@ -0,0 +1,249 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmarks of the callbacks dispatch.
+
+Every bench_* function prepares a benchmark and returns the callable to
+time, the number of calls per timed run and, optionally, a setup callable
+run before each timed run with that number.
+
+Run with 'tox -e bench', or directly:
+
+    python -m neutron_lib.tests.benchmarks.callbacks \\
+        --output results.json [--baseline baseline.json]
+
+Results are written as JSON; when a baseline (the output of a previous run)
+is given, every benchmark is compared against it and the command fails if
+any of them got slower than the allowed threshold.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import timeit
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import registry
+from neutron_lib.callbacks import resources
+
+SUBSCRIBERS = 10000
+
+_RESOURCES = (resources.PORT, resources.ROUTER, resources.SUBNET,
+              resources.SECURITY_GROUP)
+_EVENTS = (events.AFTER_CREATE, events.AFTER_UPDATE, events.AFTER_DELETE)
+
+
+def _make_callback():
+    def callback(resource, event, trigger, **kwargs):
+        pass
+    return callback
+
+
+def _callback_raise(resource, event, trigger, **kwargs):
+    raise Exception()
+
+
+def _get_manager(subscribers, event=events.AFTER_CREATE):
+    callbacks_manager = manager.CallbacksManager()
+    for _i in range(subscribers):
+        callbacks_manager.subscribe(_make_callback(), resources.PORT, event)
+    return callbacks_manager
+
+
+def _subscribe_many(callbacks):
+    """Subscribe callbacks to the resource events, round robin."""
+    callbacks_manager = manager.CallbacksManager()
+    keys = [(resource, event) for resource in _RESOURCES
+            for event in _EVENTS]
+    for i, callback in enumerate(callbacks):
+        resource, event = keys[i % len(keys)]
+        callbacks_manager.subscribe(callback, resource, event)
+    return callbacks_manager
+
+
+def bench_subscribe():
+    """Subscribe SUBSCRIBERS callbacks to a dozen resource events."""
+    callbacks = [_make_callback() for _i in range(SUBSCRIBERS)]
+    return lambda: _subscribe_many(callbacks), 1
+
+
+def bench_unsubscribe_all():
+    """Unsubscribe SUBSCRIBERS callbacks from everything, one by one."""
+    callbacks = [_make_callback() for _i in range(SUBSCRIBERS)]
+    subscribed = []
+
+    def setup(number):
+        subscribed[:] = [_subscribe_many(callbacks) for _i in range(number)]
+
+    def unsubscribe_all():
+        callbacks_manager = subscribed.pop()
+        for callback in callbacks:
+            callbacks_manager.unsubscribe_all(callback)
+    return unsubscribe_all, 1, setup
+
+
+def _bench_notify(subscribers):
+    callbacks_manager = _get_manager(subscribers)
+    port = {'id': 'fake-id', 'device_owner': 'compute:nova'}
+
+    def notify():
+        callbacks_manager.notify(resources.PORT, events.AFTER_CREATE, None,
+                                 port=port)
+    return notify, 10000 // (subscribers or 1)
+
+
+def bench_notify_0():
+    """Notify an event without subscribers."""
+    return _bench_notify(0)
+
+
+def bench_notify_1():
+    """Notify an event with a single subscriber."""
+    return _bench_notify(1)
+
+
+def bench_notify_50():
+    """Notify an event with 50 subscribers."""
+    return _bench_notify(50)
+
+
+def bench_notify_before_abort():
+    """Notify a BEFORE_* event whose subscriber fails, down to the abort."""
+    callbacks_manager = manager.CallbacksManager()
+    callbacks_manager.subscribe(
+        _callback_raise, resources.PORT, events.BEFORE_CREATE)
+    callbacks_manager.subscribe(
+        _make_callback(), resources.PORT, events.ABORT_CREATE)
+
+    def notify():
+        try:
+            callbacks_manager.notify(resources.PORT, events.BEFORE_CREATE,
+                                     None)
+        except exceptions.CallbackFailure:
+            pass
+    return notify, 1000
+
+
+def bench_registry_notify_1():
+    """Notify an event with a single subscriber through the registry."""
+    callbacks_manager = _get_manager(1)
+    port = {'id': 'fake-id', 'device_owner': 'compute:nova'}
+
+    def notify():
+        registry.notify(resources.PORT, events.AFTER_CREATE, None, port=port)
+
+    def setup(number):
+        registry.CALLBACK_MANAGER = callbacks_manager
+    return notify, 10000, setup
+
+
+BENCHMARKS = dict((name[len('bench_'):], bench)
+                  for name, bench in globals().items()
+                  if name.startswith('bench_'))
+
+
+def run(names=None, repeat=5, scale=1.0):
+    """Run the benchmarks.
+
+    :param names: the names of the benchmarks to run, all by default.
+    :param repeat: the number of timed runs of each benchmark.
+    :param scale: a factor applied to the number of calls of each run.
+    :returns: a dict mapping the name of each benchmark to its results: the
+        number of calls per run, the number of runs, and the 'min' and
+        'median' time per call, in seconds.
+    """
+    results = {}
+    saved_manager = registry.CALLBACK_MANAGER
+    try:
+        for name in sorted(names or BENCHMARKS):
+            prepared = BENCHMARKS[name]()
+            func, number = prepared[:2]
+            setup = prepared[2] if len(prepared) > 2 else None
+            number = max(1, int(number * scale))
+            timings = []
+            for _i in range(repeat):
+                if setup is not None:
+                    setup(number)
+                timings.append(
+                    timeit.Timer(func).timeit(number=number) / number)
+            timings.sort()
+            results[name] = {'number': number,
+                             'repeat': repeat,
+                             'min': timings[0],
+                             'median': timings[len(timings) // 2]}
+    finally:
+        registry.CALLBACK_MANAGER = saved_manager
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """Compare benchmark results against a baseline.
+
+    :param results: the results of run().
+    :param baseline: the results of a previous run.
+    :param threshold: the relative slowdown of the median time tolerated.
+    :returns: a list of (name, ratio, regressed) tuples, one per benchmark
+        found in both, where ratio is the median time over the baseline one.
+    """
+    comparison = []
+    for name in sorted(set(results) & set(baseline)):
+        ratio = results[name]['median'] / baseline[name]['median']
+        comparison.append((name, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the callbacks dispatch.')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='benchmarks to run, among: %s' %
+                        ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against these results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown tolerated (default: 0.2)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    # Measure the dispatch, not the log handlers.
+    logging.disable(logging.CRITICAL)
+    results = run(args.names, repeat=args.repeat, scale=args.scale)
+    document = {'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'benchmarks': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    else:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+        regressions = 0
+        for name, ratio, regressed in compare(results, baseline,
+                                              args.threshold):
+            regressions += regressed
+            sys.stderr.write('%-24s %6.2fx%s\n' % (
+                name, ratio, ' REGRESSION' if regressed else ''))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
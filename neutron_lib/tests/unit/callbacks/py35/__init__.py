@@ -0,0 +1,27 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# NOTE: the tests of this package use native coroutine syntax, which older
+# interpreters cannot even parse, so they are only discovered on Python 3.5
+# or later.
+
+import os
+import sys
+
+
+def load_tests(loader, standard_tests, pattern):
+    if sys.version_info < (3, 5):
+        return standard_tests
+    this_dir = os.path.dirname(__file__)
+    standard_tests.addTests(loader.discover(start_dir=this_dir,
+                                            pattern=pattern))
+    return standard_tests
@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+
+import mock
+
+from neutron_lib.callbacks import async_manager
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import registry
+from neutron_lib.callbacks import resources
+from neutron_lib.tests import base
+
+
+class AsyncCallbacksManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(AsyncCallbacksManagerTestCase, self).setUp()
+        self.manager = async_manager.AsyncCallbacksManager()
+        self.calls = []
+
+    def _run(self, coro):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(coro)
+
+    async def coroutine_callback(self, resource, event, trigger, **kwargs):
+        await asyncio.sleep(0)
+        self.calls.append(('coroutine', event))
+
+    def sync_callback(self, resource, event, trigger, **kwargs):
+        self.calls.append(('sync', event))
+
+    async def raising_callback(self, resource, event, trigger, **kwargs):
+        raise Exception()
+
+    def test_notify_awaits_coroutines_and_runs_plain_callables(self):
+        self.manager.subscribe(
+            self.coroutine_callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.subscribe(
+            self.sync_callback, resources.PORT, events.AFTER_CREATE)
+        self._run(self.manager.notify(
+            resources.PORT, events.AFTER_CREATE, self))
+        self.assertEqual(
+            set([('coroutine', events.AFTER_CREATE),
+                 ('sync', events.AFTER_CREATE)]),
+            set(self.calls))
+
+    def test_notify_with_no_subscribers(self):
+        self._run(self.manager.notify(
+            resources.PORT, events.AFTER_CREATE, self))
+        self.assertEqual([], self.calls)
+
+    def test_notify_before_failure_aborts(self):
+        self.manager.subscribe(
+            self.raising_callback, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            self.coroutine_callback, resources.PORT, events.ABORT_CREATE)
+        self.assertRaises(exceptions.CallbackFailure, self._run,
+                          self.manager.notify(resources.PORT,
+                                              events.BEFORE_CREATE, self))
+        self.assertEqual([('coroutine', events.ABORT_CREATE)], self.calls)
+
+    def test_notify_after_failure_does_not_raise(self):
+        self.manager.subscribe(
+            self.raising_callback, resources.PORT, events.AFTER_CREATE)
+        self._run(self.manager.notify(
+            resources.PORT, events.AFTER_CREATE, self))
+
+    def test_registry_async_notify_shares_subscriptions(self):
+        callbacks_manager = manager.CallbacksManager()
+        callbacks_manager.subscribe(
+            self.coroutine_callback, resources.PORT, events.AFTER_UPDATE)
+        with mock.patch.object(registry, '_get_callback_manager',
+                               return_value=callbacks_manager):
+            self._run(registry.async_notify(
+                resources.PORT, events.AFTER_UPDATE, self))
+        self.assertEqual([('coroutine', events.AFTER_UPDATE)], self.calls)
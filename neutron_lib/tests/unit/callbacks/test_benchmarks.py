@@ -0,0 +1,34 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_lib.callbacks import registry
+from neutron_lib.tests import base
+from neutron_lib.tests.benchmarks import callbacks
+
+
+class CallbacksBenchmarksTestCase(base.BaseTestCase):
+
+    def test_run(self):
+        saved_manager = registry.CALLBACK_MANAGER
+        results = callbacks.run(['notify_1', 'registry_notify_1'],
+                                repeat=1, scale=0.001)
+        self.assertEqual(set(['notify_1', 'registry_notify_1']),
+                         set(results))
+        self.assertEqual(10, results['notify_1']['number'])
+        self.assertIs(saved_manager, registry.CALLBACK_MANAGER)
+
+    def test_compare(self):
+        baseline = {'a': {'median': 1.0}, 'b': {'median': 1.0}}
+        results = {'a': {'median': 1.1}, 'b': {'median': 1.5},
+                   'c': {'median': 1.0}}
+        self.assertEqual([('a', 1.1, False), ('b', 1.5, True)],
+                         callbacks.compare(results, baseline, threshold=0.2))
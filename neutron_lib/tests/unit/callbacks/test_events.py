@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import pickle
+
+from neutron_lib.callbacks import events
+from neutron_lib.tests import base
+
+
+class EventRegistryTestCase(base.BaseTestCase):
+
+    def test_core_events_precomputed(self):
+        self.assertEqual(events.ABORT_CREATE,
+                         events.get_abort_event(events.BEFORE_CREATE))
+        self.assertIsNone(events.get_abort_event(events.AFTER_CREATE))
+        self.assertEqual(events.AFTER,
+                         events.get_event_class(events.AFTER_DELETE))
+        self.assertEqual(events.ABORT,
+                         events.get_event_class(events.ABORT_READ))
+        self.assertTrue(events.is_before(events.BEFORE_UPDATE))
+        self.assertFalse(events.is_after(events.BEFORE_UPDATE))
+
+    def test_unknown_event_registered_on_first_use(self):
+        event = ''.join(['before_', 'frobnicate'])
+        self.assertNotIn(event, events._EVENTS)
+        self.assertEqual('abort_frobnicate', events.get_abort_event(event))
+        self.assertIs(events._EVENTS[event].event, events.register(event))
+
+    def test_register_interns(self):
+        event = ''.join(['after_', 'frobnicate'])
+        self.assertIs(events.register('after_frobnicate'),
+                      events.register(event))
+        self.assertIsNone(events.get_event_class('frobnicated'))
+
+
+class EventPayloadTestCase(base.BaseTestCase):
+
+    def test_defaults(self):
+        payload = events.EventPayload('ctx')
+        self.assertEqual({}, payload.metadata)
+        self.assertEqual((), payload.states)
+        self.assertFalse(payload.has_states)
+        self.assertIsNone(payload.latest_state)
+        self.assertIsNone(payload.resource_id)
+
+    def test_latest_state(self):
+        payload = events.EventPayload('ctx', states=[{'v': 1}, {'v': 2}])
+        self.assertTrue(payload.has_states)
+        self.assertEqual({'v': 2}, payload.latest_state)
+
+    def test_immutable(self):
+        payload = events.EventPayload('ctx', resource_id='id')
+        self.assertRaises(AttributeError, setattr, payload, 'resource_id', 1)
+        self.assertRaises(AttributeError, setattr, payload, 'foo', 1)
+        self.assertRaises(AttributeError, delattr, payload, 'resource_id')
+
+    def test_no_instance_dict(self):
+        for payload in (events.EventPayload('ctx'),
+                        events.DBEventPayload('ctx'),
+                        events.APIEventPayload('ctx', 'create_port',
+                                               'create')):
+            self.assertFalse(hasattr(payload, '__dict__'))
+
+    def test_copy_and_pickle(self):
+        for payload in (events.EventPayload('ctx', metadata={'m': [1]},
+                                            states=[{'v': 1}]),
+                        events.DBEventPayload('ctx', resource_id='id',
+                                              desired_state={'v': 2}),
+                        events.APIEventPayload('ctx', 'create_port',
+                                               'create', request_body={},
+                                               collection_name='ports')):
+            for copied in (copy.copy(payload), copy.deepcopy(payload),
+                           pickle.loads(pickle.dumps(payload, 2))):
+                self.assertIs(type(payload), type(copied))
+                self.assertEqual(repr(payload), repr(copied))
+                self.assertEqual('ctx', copied.context)
+                self.assertRaises(AttributeError, setattr, copied,
+                                  'resource_id', 'other')
+            self.assertIsNot(payload.metadata,
+                             copy.deepcopy(payload).metadata)
+
+    def test_db_payload_desired_state(self):
+        payload = events.DBEventPayload('ctx', states=[{'v': 1}],
+                                        desired_state={'v': 2})
+        self.assertFalse(payload.is_persisted)
+        self.assertEqual({'v': 2}, payload.latest_state)
+        payload = events.DBEventPayload('ctx', states=[{'v': 1}])
+        self.assertTrue(payload.is_persisted)
+        self.assertEqual({'v': 1}, payload.latest_state)
+
+    def test_api_payload_repr(self):
+        payload = events.APIEventPayload('ctx', 'create_port', 'create',
+                                         resource_id='id')
+        self.assertIn("method_name='create_port'", repr(payload))
+        self.assertIn("resource_id='id'", repr(payload))
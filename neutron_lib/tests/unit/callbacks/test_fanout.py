@@ -0,0 +1,118 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+
+import mock
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import fanout
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import resources
+from neutron_lib.tests import base
+
+
+class WorkerFanoutTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(WorkerFanoutTestCase, self).setUp()
+        self.path = path = self.get_new_temp_dir().path
+        self.manager_1 = manager.CallbacksManager()
+        self.manager_2 = manager.CallbacksManager()
+        self.fanout_1 = fanout.WorkerFanout(
+            path, self.manager_1, worker_id='w1', batch_size=2)
+        self.fanout_2 = fanout.WorkerFanout(
+            path, self.manager_2, worker_id='w2', batch_size=2)
+        # Receive explicitly rather than from green threads.
+        self.spawn = mock.patch.object(fanout.eventlet, 'spawn').start()
+        self.spawn_after = mock.patch.object(
+            fanout.eventlet, 'spawn_after').start()
+        self.addCleanup(mock.patch.stopall)
+        self.fanout_1.start()
+        self.fanout_2.start()
+        self.addCleanup(self.fanout_1.stop)
+        self.addCleanup(self.fanout_2.stop)
+        self.assertEqual(2, self.spawn.call_count)
+        self.spawn.reset_mock()
+        self.callback = mock.Mock()
+        self.manager_2.subscribe(
+            self.callback, resources.PORT, events.AFTER_UPDATE)
+
+    def test_forward_before_event_is_invalid(self):
+        self.assertRaises(exceptions.Invalid, self.fanout_1.forward,
+                          resources.PORT, events.BEFORE_UPDATE)
+
+    def test_forward_batch(self):
+        self.fanout_1.forward(resources.PORT, events.AFTER_UPDATE)
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              port={'id': 'p1'})
+        self.assertEqual(1, self.spawn_after.call_count)
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              port={'id': 'p2'})
+        self.spawn.assert_called_once_with(self.fanout_1.flush)
+        self.fanout_1.flush()
+        self.fanout_2._receive()
+        self.callback.assert_has_calls([
+            mock.call(resources.PORT, events.AFTER_UPDATE, self.fanout_2,
+                      port={'id': 'p1'}),
+            mock.call(resources.PORT, events.AFTER_UPDATE, self.fanout_2,
+                      port={'id': 'p2'})])
+
+    def test_forward_selected_keys(self):
+        self.fanout_1.forward(resources.PORT, events.AFTER_UPDATE,
+                              keys=['port'])
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              context=object(), port={'id': 'p1'})
+        self.fanout_1.flush()
+        self.fanout_2._receive()
+        self.callback.assert_called_once_with(
+            resources.PORT, events.AFTER_UPDATE, self.fanout_2,
+            port={'id': 'p1'})
+
+    def test_forward_drops_unserializable_keys(self):
+        self.fanout_1.forward(resources.PORT, events.AFTER_UPDATE)
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              context=object(), port={'id': 'p1'})
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              port={'id': 'p2'})
+        self.spawn.assert_called_once_with(self.fanout_1.flush)
+        self.fanout_1.flush()
+        self.fanout_2._receive()
+        self.callback.assert_has_calls([
+            mock.call(resources.PORT, events.AFTER_UPDATE, self.fanout_2,
+                      port={'id': 'p1'}),
+            mock.call(resources.PORT, events.AFTER_UPDATE, self.fanout_2,
+                      port={'id': 'p2'})])
+
+    def test_stalled_sibling_does_not_block(self):
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.addCleanup(stalled.close)
+        stalled.bind(os.path.join(self.path, 'stalled.sock'))
+        self.fanout_1.forward(resources.PORT, events.AFTER_UPDATE)
+        for i in range(1000):
+            self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                                  port={'id': 'p%d' % i})
+            self.fanout_1.flush()
+        stats = self.fanout_1.get_stats()
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(2000, stats['sent'] + stats['dropped'])
+
+    def test_received_events_are_not_forwarded_back(self):
+        self.fanout_1.forward(resources.PORT, events.AFTER_UPDATE)
+        self.fanout_2.forward(resources.PORT, events.AFTER_UPDATE)
+        self.manager_1.notify(resources.PORT, events.AFTER_UPDATE, self,
+                              port={'id': 'p1'})
+        self.fanout_1.flush()
+        self.fanout_2._receive()
+        self.assertEqual([], self.fanout_2._queue)
@@ -0,0 +1,146 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+
+import mock
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import journal
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import resources
+from neutron_lib.tests import base
+
+
+class EventJournalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(EventJournalTestCase, self).setUp()
+        self.path = self.get_new_temp_dir().path
+        self.manager = manager.CallbacksManager()
+
+    def _start_journal(self, **kwargs):
+        event_journal = journal.EventJournal(self.path, self.manager,
+                                             **kwargs)
+        event_journal.start()
+        self.addCleanup(event_journal.stop)
+        return event_journal
+
+    def test_record_and_read(self):
+        event_journal = self._start_journal()
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, 'trigger',
+                            port={'id': 'p1'}, context=object())
+        self.manager.notify_many(resources.ROUTER, events.AFTER_DELETE, self,
+                                 [{'router_id': 'r1'}, {'router_id': 'r2'}])
+        event_journal.stop()
+        entries = [entry[1:] for entry in journal.read_journal(self.path)]
+        self.assertEqual(
+            [(resources.PORT, events.AFTER_CREATE, 'trigger',
+              {'port': {'id': 'p1'}}),
+             (resources.ROUTER, events.AFTER_DELETE,
+              'neutron_lib.tests.unit.callbacks.test_journal.'
+              'EventJournalTestCase', {'router_id': 'r1'}),
+             (resources.ROUTER, events.AFTER_DELETE,
+              'neutron_lib.tests.unit.callbacks.test_journal.'
+              'EventJournalTestCase', {'router_id': 'r2'})],
+            entries)
+
+    def test_record_selected_keys(self):
+        event_journal = self._start_journal(keys=['port'])
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, 'trigger',
+                            port={'id': 'p1'}, original_port={'id': 'p1'})
+        event_journal.stop()
+        self.assertEqual(
+            [{'port': {'id': 'p1'}}],
+            [entry[-1] for entry in journal.read_journal(self.path)])
+
+    def test_rotation(self):
+        event_journal = self._start_journal(segment_size=256,
+                                            max_segments=2)
+        for i in range(30):
+            self.manager.notify(resources.PORT, events.AFTER_UPDATE,
+                                'trigger', port={'id': 'p%d' % i})
+        event_journal.stop()
+        self.assertEqual(2, len(journal._get_segments(self.path)))
+        entries = list(journal.read_journal(self.path))
+        self.assertTrue(0 < len(entries) < 30)
+        self.assertEqual({'port': {'id': 'p29'}}, entries[-1][-1])
+
+    def test_replay(self):
+        event_journal = self._start_journal()
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, 'trigger',
+                            port={'id': 'p1'})
+        event_journal.stop()
+        callback = mock.Mock()
+        replay_manager = manager.CallbacksManager()
+        replay_manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE)
+        self.assertEqual((1, 0),
+                         journal.replay(self.path, replay_manager))
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, 'trigger',
+            port={'id': 'p1'})
+
+    def test_segments_allocated(self):
+        event_journal = self._start_journal(segment_size=4096)
+        stat = os.fstat(event_journal._file.fileno())
+        self.assertEqual(4096, stat.st_size)
+        self.assertGreaterEqual(stat.st_blocks * 512, 4096)
+
+    def test_segments_filled_without_fallocate(self):
+        with mock.patch.object(journal.os, 'posix_fallocate',
+                               side_effect=OSError(errno.EOPNOTSUPP, ''),
+                               create=True):
+            event_journal = self._start_journal(segment_size=70000)
+        event_journal._file.seek(0)
+        self.assertEqual(b'\0' * 70000, event_journal._file.read())
+
+    def test_record_failure_does_not_abort(self):
+        self._start_journal(segment_size=256)
+        with mock.patch.object(journal, '_allocate',
+                               side_effect=OSError(errno.ENOSPC, '')):
+            for i in range(10):
+                self.manager.notify(resources.PORT, events.BEFORE_UPDATE,
+                                    'trigger', port={'id': 'p%d' % i})
+        self.manager.notify(resources.PORT, events.BEFORE_UPDATE,
+                            'trigger', port={'id': 'p10'})
+        entries = list(journal.read_journal(self.path))
+        self.assertEqual({'port': {'id': 'p10'}}, entries[-1][-1])
+
+    def test_shared_directory(self):
+        other_manager = manager.CallbacksManager()
+        first = self._start_journal()
+        second = journal.EventJournal(self.path, other_manager)
+        second.start()
+        self.addCleanup(second.stop)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, 'first')
+        other_manager.notify(resources.PORT, events.AFTER_CREATE, 'second')
+        first.stop()
+        second.stop()
+        self.assertEqual(2, len(journal._get_segments(self.path)))
+        self.assertEqual(
+            set(['first', 'second']),
+            set(entry[3] for entry in journal.read_journal(self.path)))
+
+    def test_locked_segments_not_removed(self):
+        other_manager = manager.CallbacksManager()
+        other = journal.EventJournal(self.path, other_manager)
+        other.start()
+        self.addCleanup(other.stop)
+        locked, = journal._get_segments(self.path)
+        self._start_journal(segment_size=256, max_segments=1)
+        for i in range(10):
+            self.manager.notify(resources.PORT, events.AFTER_UPDATE,
+                                'trigger', port={'id': 'p%d' % i})
+        self.assertTrue(os.path.exists(locked))
+        self.assertEqual(2, len(journal._get_segments(self.path)))
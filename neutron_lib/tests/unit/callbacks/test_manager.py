@@ -0,0 +1,737 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gc
+import threading
+import weakref
+
+import eventlet
+import mock
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions
+from neutron_lib.callbacks import manager
+from neutron_lib.callbacks import resources
+from neutron_lib.tests import base
+
+
+def callback_1(*args, **kwargs):
+    callback_1.counter += 1
+callback_1.counter = 0
+
+
+def callback_2(*args, **kwargs):
+    callback_2.counter += 1
+callback_2.counter = 0
+
+
+def callback_raise(*args, **kwargs):
+    raise Exception()
+
+
+class ObjectWithCallback(object):
+
+    def __init__(self):
+        self.counter = 0
+
+    def callback(self, *args, **kwargs):
+        self.counter += 1
+
+
+class CallableObject(object):
+
+    def __init__(self):
+        self.counter = 0
+
+    def __call__(self, *args, **kwargs):
+        self.counter += 1
+
+
+class CallBacksManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(CallBacksManagerTestCase, self).setUp()
+        self.manager = manager.CallbacksManager()
+        callback_1.counter = 0
+        callback_2.counter = 0
+
+    def test_subscribe_builds_dispatch_table(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.BEFORE_CREATE)
+        dispatch = self.manager._dispatch[
+            resources.PORT, events.BEFORE_CREATE]
+        self.assertIsInstance(dispatch, tuple)
+        self.assertEqual(set([callback_1, callback_2]),
+                         set(sub.callback for sub in dispatch))
+
+    def test_unsubscribe_drops_dispatch_entry(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.unsubscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.assertNotIn((resources.PORT, events.BEFORE_CREATE),
+                         self.manager._dispatch)
+
+    def test_unsubscribe_by_resource_updates_dispatch(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_DELETE)
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.BEFORE_DELETE)
+        self.manager.unsubscribe_by_resource(callback_1, resources.PORT)
+        self.assertNotIn((resources.PORT, events.BEFORE_CREATE),
+                         self.manager._dispatch)
+        self.assertEqual(
+            1, len(self.manager._dispatch[
+                resources.PORT, events.BEFORE_DELETE]))
+
+    def test_unsubscribe_all_updates_dispatch(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_1, resources.ROUTER, events.BEFORE_DELETE)
+        self.manager.unsubscribe_all(callback_1)
+        self.assertEqual({}, self.manager._dispatch)
+
+    def test_clear(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.clear()
+        self.assertEqual({}, self.manager._dispatch)
+        self.assertEqual(0, len(self.manager._callbacks))
+        self.assertEqual(0, len(self.manager._index))
+
+    def test_notify_with_no_subscribers(self):
+        with mock.patch.object(manager.LOG, 'debug') as debug:
+            self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertFalse(debug.called)
+        self.assertNotIn(resources.PORT, self.manager._callbacks)
+
+    def test_notify_without_errors_skips_abort_lookup(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        with mock.patch.object(manager.events, 'get_abort_event') as lookup:
+            self.manager.notify(resources.PORT, 'before_unknown', self)
+            self.manager.notify(resources.PORT, events.BEFORE_CREATE, self)
+            self.manager.notify_many(resources.PORT, events.BEFORE_CREATE,
+                                     self, [{}, {}])
+        self.assertFalse(lookup.called)
+        self.assertEqual(3, callback_1.counter)
+
+    def test_notify_calls_all_subscribers(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.BEFORE_CREATE)
+        self.manager.notify(resources.PORT, events.BEFORE_CREATE, self)
+        self.assertEqual(1, callback_1.counter)
+        self.assertEqual(1, callback_2.counter)
+
+    def test_notify_with_precommit_exception_aborts(self):
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.ABORT_CREATE)
+        self.assertRaises(exceptions.CallbackFailure, self.manager.notify,
+                          resources.PORT, events.BEFORE_CREATE, self)
+        self.assertEqual(1, callback_1.counter)
+
+    def test_notify_with_after_exception_does_not_raise(self):
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+
+    def test_notify_after_event_concurrently(self):
+        concurrent = manager.CallbacksManager(max_workers=4)
+        concurrent.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        concurrent.subscribe(
+            callback_2, resources.PORT, events.AFTER_CREATE)
+        with mock.patch.object(manager.eventlet, 'GreenPile',
+                               wraps=manager.eventlet.GreenPile) as pile:
+            concurrent.notify(resources.PORT, events.AFTER_CREATE, self)
+        pile.assert_called_once_with(4)
+        self.assertEqual(1, callback_1.counter)
+        self.assertEqual(1, callback_2.counter)
+
+    def test_notify_before_event_is_never_concurrent(self):
+        concurrent = manager.CallbacksManager(max_workers=4)
+        concurrent.subscribe(
+            callback_1, resources.PORT, events.BEFORE_CREATE)
+        concurrent.subscribe(
+            callback_2, resources.PORT, events.BEFORE_CREATE)
+        with mock.patch.object(manager.eventlet, 'GreenPile') as pile:
+            concurrent.notify(resources.PORT, events.BEFORE_CREATE, self)
+        self.assertFalse(pile.called)
+        self.assertEqual(1, callback_1.counter)
+        self.assertEqual(1, callback_2.counter)
+
+    def test_notify_concurrently_collects_all_errors(self):
+        def callback_raise_2(*args, **kwargs):
+            raise Exception()
+
+        concurrent = manager.CallbacksManager(max_workers=4)
+        concurrent.subscribe(
+            callback_raise, resources.PORT, events.AFTER_CREATE)
+        concurrent.subscribe(
+            callback_raise_2, resources.PORT, events.AFTER_CREATE)
+        concurrent.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        errors = concurrent._notify_loop(
+            resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(2, len(errors))
+        self.assertEqual(1, callback_1.counter)
+
+    def test_get_id_bound_methods_of_different_instances(self):
+        obj_1 = ObjectWithCallback()
+        obj_2 = ObjectWithCallback()
+        self.assertNotEqual(manager._get_id(obj_1.callback),
+                            manager._get_id(obj_2.callback))
+        self.assertEqual(manager._get_id(obj_1.callback),
+                         manager._get_id(obj_1.callback))
+
+    def test_subscribe_bound_methods_of_different_instances(self):
+        obj_1 = ObjectWithCallback()
+        obj_2 = ObjectWithCallback()
+        self.manager.subscribe(
+            obj_1.callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.subscribe(
+            obj_2.callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(1, obj_1.counter)
+        self.assertEqual(1, obj_2.counter)
+        self.manager.unsubscribe(
+            obj_1.callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(1, obj_1.counter)
+        self.assertEqual(2, obj_2.counter)
+
+    def test_notification_error_reports_callback_name(self):
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.AFTER_CREATE)
+        errors = self.manager._notify_loop(
+            resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(manager._get_name(callback_raise),
+                         errors[0].callback_id)
+
+    def test_subscribe_weak_bound_method(self):
+        obj = ObjectWithCallback()
+        self.manager.subscribe(
+            obj.callback, resources.PORT, events.AFTER_CREATE, weak=True)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(1, obj.counter)
+
+    def test_subscribe_weak_purged_on_collection(self):
+        obj = ObjectWithCallback()
+        self.manager.subscribe(
+            obj.callback, resources.PORT, events.AFTER_CREATE, weak=True)
+        self.manager.subscribe(
+            obj.callback, resources.ROUTER, events.AFTER_DELETE, weak=True)
+        del obj
+        gc.collect()
+        self.assertEqual({}, self.manager._dispatch)
+        self.assertEqual(0, len(self.manager._index))
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+
+    def test_subscribe_weak_function(self):
+        def callback(*args, **kwargs):
+            callback.counter += 1
+        callback.counter = 0
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE, weak=True)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(1, callback.counter)
+        self.manager.unsubscribe_all(callback)
+        self.assertEqual({}, self.manager._dispatch)
+
+    def test_subscribe_weak_function_purged_on_collection(self):
+        def callback(*args, **kwargs):
+            pass
+        ref = weakref.ref(callback)
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE, weak=True)
+        del callback
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual({}, self.manager._dispatch)
+        self.assertEqual(0, len(self.manager._index))
+
+    def test_subscribe_weak_callable_object_purged_on_collection(self):
+        obj = CallableObject()
+        ref = weakref.ref(obj)
+        self.manager.subscribe(
+            obj, resources.PORT, events.AFTER_CREATE, weak=True)
+        self.manager.subscribe(
+            obj, resources.ROUTER, events.AFTER_DELETE, weak=True)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(1, obj.counter)
+        del obj
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual({}, self.manager._dispatch)
+        self.assertEqual(0, len(self.manager._index))
+
+    def test_subscribe_weak_reports_callback_name(self):
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.AFTER_CREATE, weak=True)
+        errors = self.manager._notify_loop(
+            resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(manager._get_name(callback_raise),
+                         errors[0].callback_id)
+
+    def test_notify_many_legacy_callback_called_per_payload(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify_many(resources.PORT, events.AFTER_CREATE, self,
+                                 [{'port': 1}, {'port': 2}])
+        callback.assert_has_calls([
+            mock.call(resources.PORT, events.AFTER_CREATE, self, port=1),
+            mock.call(resources.PORT, events.AFTER_CREATE, self, port=2)])
+
+    def test_notify_many_batch_callback_called_once(self):
+        callback = mock.Mock()
+        payloads = [{'port': 1}, {'port': 2}]
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE, batch=True)
+        self.manager.notify_many(resources.PORT, events.AFTER_CREATE, self,
+                                 payloads)
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self, payloads=payloads)
+
+    def test_notify_batch_callback_receives_batch_of_one(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE, batch=True)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port=1)
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self, payloads=[{'port': 1}])
+
+    def test_notify_many_with_precommit_exception_aborts_once(self):
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.ABORT_CREATE)
+        self.assertRaises(exceptions.CallbackFailure,
+                          self.manager.notify_many,
+                          resources.PORT, events.BEFORE_CREATE, self,
+                          [{'port': 1}, {'port': 2}])
+        self.assertEqual(1, callback_1.counter)
+
+    def test_notify_many_without_payloads(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify_many(resources.PORT, events.AFTER_CREATE, self,
+                                 [])
+        self.assertFalse(callback.called)
+
+    def test_coalesce_dispatches_latest_payload_once(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_UPDATE)
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0.5)
+        with mock.patch.object(manager.eventlet, 'spawn_after') as spawn:
+            for status in ('DOWN', 'BUILD', 'ACTIVE'):
+                self.manager.notify(
+                    resources.PORT, events.AFTER_UPDATE, self,
+                    port={'id': 'p1', 'status': status})
+        self.assertFalse(callback.called)
+        spawn.assert_called_once_with(
+            0.5, self.manager._flush_coalesced,
+            (resources.PORT, events.AFTER_UPDATE, 'p1'))
+        self.manager._flush_coalesced(
+            (resources.PORT, events.AFTER_UPDATE, 'p1'))
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_UPDATE, self,
+            port={'id': 'p1', 'status': 'ACTIVE'})
+        self.assertEqual(
+            {(resources.PORT, events.AFTER_UPDATE): {
+                'received': 3, 'dispatched': 1, 'suppressed': 2}},
+            self.manager.get_coalesce_counters())
+
+    def test_coalesce_without_object_id_dispatches_immediately(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_UPDATE)
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0.5)
+        with mock.patch.object(manager.eventlet, 'spawn_after') as spawn:
+            self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.assertFalse(spawn.called)
+        self.assertTrue(callback.called)
+
+    def test_coalesce_before_event_is_invalid(self):
+        self.assertRaises(exceptions.Invalid, self.manager.coalesce,
+                          resources.PORT, events.BEFORE_UPDATE, 0.5)
+
+    def test_coalesce_disabled(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_UPDATE)
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0.5)
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0)
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self,
+                            port={'id': 'p1'})
+        self.assertTrue(callback.called)
+
+    def test_get_stats_disabled(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual([], self.manager.get_stats())
+
+    def test_get_stats(self):
+        self.manager.enable_stats()
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.AFTER_CREATE)
+        with mock.patch.object(manager, '_now',
+                               side_effect=[0.0, 0.000010] * 4):
+            self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+            self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        stats = dict((s['callback'], s) for s in self.manager.get_stats())
+        callback_1_stats = stats[manager._get_name(callback_1)]
+        self.assertEqual(2, callback_1_stats['calls'])
+        self.assertEqual(0, callback_1_stats['errors'])
+        self.assertEqual(resources.PORT, callback_1_stats['resource'])
+        self.assertEqual(events.AFTER_CREATE, callback_1_stats['event'])
+        self.assertAlmostEqual(0.000020, callback_1_stats['total_time'])
+        self.assertAlmostEqual(0.000010, callback_1_stats['max_time'])
+        self.assertEqual({16: 2}, callback_1_stats['histogram'])
+        self.assertEqual(2, stats[manager._get_name(callback_raise)]['errors'])
+
+    def test_enable_stats_resets(self):
+        self.manager.enable_stats()
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.manager.enable_stats()
+        self.assertEqual([], self.manager.get_stats())
+        self.manager.enable_stats(False)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual([], self.manager.get_stats())
+
+    def test_dispatch_table_is_copied_on_write(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        dispatch = self.manager._dispatch
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.AFTER_CREATE)
+        self.assertIsNot(dispatch, self.manager._dispatch)
+        self.assertEqual(
+            1, len(dispatch[resources.PORT, events.AFTER_CREATE]))
+
+    def test_subscribe_while_notifying_from_other_threads(self):
+        stop = threading.Event()
+        errors = []
+
+        def notifier():
+            try:
+                while not stop.is_set():
+                    self.manager.notify(
+                        resources.PORT, events.AFTER_CREATE, self)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=notifier) for _i in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _i in range(200):
+                obj = ObjectWithCallback()
+                self.manager.subscribe(
+                    obj.callback, resources.PORT, events.AFTER_CREATE)
+                self.manager.unsubscribe_all(obj.callback)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([], errors)
+
+    def test_subscribe_any_resource(self):
+        callback = mock.Mock()
+        self.manager.subscribe(callback, '*', events.AFTER_CREATE)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.manager.notify(resources.ROUTER, events.AFTER_CREATE, self)
+        self.manager.notify(resources.ROUTER, events.AFTER_DELETE, self)
+        callback.assert_has_calls([
+            mock.call(resources.PORT, events.AFTER_CREATE, self),
+            mock.call(resources.ROUTER, events.AFTER_CREATE, self)])
+        self.assertEqual(2, callback.call_count)
+
+    def test_subscribe_event_pattern_is_precompiled(self):
+        callback = mock.Mock()
+        self.manager.subscribe(callback, resources.PORT, 'after_*')
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.manager.notify(resources.PORT, events.BEFORE_UPDATE, self)
+        self.assertEqual(1, callback.call_count)
+        self.assertEqual(
+            1, len(self.manager._dispatch[
+                resources.PORT, events.AFTER_UPDATE]))
+        self.assertEqual(
+            (), self.manager._dispatch[resources.PORT, events.BEFORE_UPDATE])
+
+    def test_subscribe_wildcard_updates_compiled_entries(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_UPDATE)
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.manager.subscribe(callback, '*', '*')
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.assertEqual(2, callback_1.counter)
+        self.assertEqual(1, callback.call_count)
+        self.manager.unsubscribe(callback, '*', '*')
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.assertEqual(3, callback_1.counter)
+        self.assertEqual(1, callback.call_count)
+        self.assertEqual(frozenset(), self.manager._patterns)
+
+    def test_subscribe_wildcard_and_exact_called_once(self):
+        self.manager.subscribe(callback_1, '*', '*')
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_UPDATE)
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.assertEqual(1, callback_1.counter)
+        self.manager.unsubscribe_all(callback_1)
+        self.manager.notify(resources.PORT, events.AFTER_UPDATE, self)
+        self.assertEqual(1, callback_1.counter)
+
+    def test_subscribe_with_filters(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE,
+            filters={'port.device_owner': ['network:router_interface']})
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port={'device_owner': 'compute:nova'})
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertFalse(callback.called)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port={'device_owner': 'network:router_interface'})
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self,
+            port={'device_owner': 'network:router_interface'})
+        self.assertEqual(
+            [{'callback': manager._get_name(callback),
+              'resource': resources.PORT,
+              'event': events.AFTER_CREATE,
+              'skipped': 2}],
+            self.manager.get_filter_stats())
+
+    def test_subscribe_with_filters_single_value(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE,
+            filters={'port.status': 'ACTIVE'})
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port={'status': 'A'})
+        self.assertFalse(callback.called)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port={'status': 'ACTIVE'})
+        self.assertTrue(callback.called)
+
+    def test_subscribe_with_filters_batch(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE, batch=True,
+            filters={'port.status': ['ACTIVE']})
+        self.manager.notify_many(resources.PORT, events.AFTER_CREATE, self,
+                                 [{'port': {'status': 'DOWN'}},
+                                  {'port': {'status': 'ACTIVE'}}])
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self,
+            payloads=[{'port': {'status': 'ACTIVE'}}])
+
+    def test_filters_key_path_looked_up_once_per_payload(self):
+        port = mock.MagicMock()
+        port.__getitem__.return_value = 'ACTIVE'
+        for _i in range(3):
+            self.manager.subscribe(
+                mock.Mock(), resources.PORT, events.AFTER_CREATE,
+                filters={'port.status': ['ACTIVE']})
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self,
+                            port=port)
+        port.__getitem__.assert_called_once_with('status')
+
+    def test_subscribe_with_timeout(self):
+        def callback_sleep(*args, **kwargs):
+            eventlet.sleep(1)
+        self.manager.subscribe(
+            callback_sleep, resources.PORT, events.BEFORE_CREATE,
+            timeout=0.01)
+        e = self.assertRaises(exceptions.CallbackFailure, self.manager.notify,
+                              resources.PORT, events.BEFORE_CREATE, self)
+        self.assertIsInstance(e.errors[0].error, exceptions.CallbackTimeout)
+
+    def test_failing_callback_skipped_until_cooldown(self):
+        self.manager = manager.CallbacksManager(failure_threshold=2,
+                                                failure_cooldown=10)
+        callback = mock.Mock(side_effect=[Exception(), Exception(), None])
+        self.manager.subscribe(
+            callback, resources.PORT, events.BEFORE_CREATE)
+        with mock.patch.object(manager, '_now', return_value=100):
+            for _i in range(3):
+                e = self.assertRaises(
+                    exceptions.CallbackFailure, self.manager.notify,
+                    resources.PORT, events.BEFORE_CREATE, self)
+            self.assertEqual([{'callback': manager._get_name(callback),
+                               'failures': 2, 'trips': 1, 'skipped': 1,
+                               'open': True}],
+                             self.manager.get_breaker_stats())
+        self.assertEqual(2, callback.call_count)
+        self.assertIsInstance(e.errors[0].error, exceptions.CallbackSkipped)
+        with mock.patch.object(manager, '_now', return_value=110):
+            self.manager.notify(resources.PORT, events.BEFORE_CREATE, self)
+        self.assertEqual(3, callback.call_count)
+        self.assertEqual(0, self.manager.get_breaker_stats()[0]['failures'])
+
+    def test_unsubscribe_forgets_breaker_and_stats(self):
+        self.manager = manager.CallbacksManager(collect_stats=True,
+                                                failure_threshold=1)
+        callback = mock.Mock(side_effect=[Exception(), None])
+        for unsubscribe in (
+                lambda: self.manager.unsubscribe(
+                    callback, resources.PORT, events.BEFORE_CREATE),
+                lambda: self.manager.unsubscribe_by_resource(
+                    callback, resources.PORT),
+                lambda: self.manager.unsubscribe_all(callback)):
+            callback.reset_mock()
+            callback.side_effect = [Exception(), None]
+            self.manager.subscribe(
+                callback, resources.PORT, events.BEFORE_CREATE,
+                filters={'port.id': ['p1']})
+            self.assertRaises(exceptions.CallbackFailure,
+                              self.manager.notify, resources.PORT,
+                              events.BEFORE_CREATE, self, port={'id': 'p1'})
+            self.manager.notify(resources.PORT, events.BEFORE_CREATE, self,
+                                port={'id': 'p2'})
+            unsubscribe()
+            self.assertEqual([], self.manager.get_breaker_stats())
+            self.assertEqual([], self.manager.get_stats())
+            self.assertEqual([], self.manager.get_filter_stats())
+            # Subscribed again, or another object reusing the same id.
+            self.manager.subscribe(
+                callback, resources.PORT, events.BEFORE_CREATE)
+            self.manager.notify(resources.PORT, events.BEFORE_CREATE, self)
+            self.assertEqual(2, callback.call_count)
+            self.manager.unsubscribe_all(callback)
+
+    def test_failures_reset_by_success(self):
+        self.manager = manager.CallbacksManager(failure_threshold=2)
+        callback = mock.Mock(side_effect=[Exception(), None, Exception()])
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE)
+        for _i in range(3):
+            self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        stats = self.manager.get_breaker_stats()
+        self.assertEqual(1, stats[0]['failures'])
+        self.assertEqual(0, stats[0]['trips'])
+
+    def test_publish(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE)
+        payload = events.DBEventPayload(mock.ANY, resource_id='p1')
+        self.manager.publish(resources.PORT, events.AFTER_CREATE, self,
+                             payload=payload)
+        callback.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self, payload=payload)
+
+    def test_publish_invalid_payload(self):
+        self.assertRaises(exceptions.Invalid, self.manager.publish,
+                          resources.PORT, events.AFTER_CREATE, self,
+                          payload={'id': 'p1'})
+
+    def test_publish_abort_carries_payload(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback_raise, resources.PORT, events.BEFORE_CREATE)
+        self.manager.subscribe(
+            callback, resources.PORT, events.ABORT_CREATE)
+        payload = events.EventPayload(mock.ANY)
+        self.assertRaises(exceptions.CallbackFailure, self.manager.publish,
+                          resources.PORT, events.BEFORE_CREATE, self,
+                          payload=payload)
+        callback.assert_called_once_with(
+            resources.PORT, events.ABORT_CREATE, self, payload=payload)
+
+    def test_publish_with_filters_on_payload(self):
+        callback = mock.Mock()
+        self.manager.subscribe(
+            callback, resources.PORT, events.AFTER_CREATE,
+            filters={'payload.resource_id': ['p1']})
+        for resource_id in ('p1', 'p2'):
+            self.manager.publish(
+                resources.PORT, events.AFTER_CREATE, self,
+                payload=events.EventPayload(mock.ANY,
+                                            resource_id=resource_id))
+        self.assertEqual(1, callback.call_count)
+
+    def test_subscribe_interns_dispatch_keys(self):
+        resource = ''.join(['po', 'rt'])
+        self.manager.subscribe(callback_1, resource, events.AFTER_CREATE)
+        (key_resource, _event), = self.manager._dispatch
+        self.assertIs(resources.PORT, key_resource)
+
+    def test_restore_snapshot(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        token = self.manager.snapshot()
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.AFTER_CREATE)
+        self.manager.unsubscribe_all(callback_1)
+        self.manager.subscribe(
+            callback_1, resources.ROUTER, events.AFTER_CREATE)
+        self.manager.restore(token)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.manager.notify(resources.ROUTER, events.AFTER_CREATE, self)
+        self.assertEqual(1, callback_1.counter)
+        self.assertEqual(0, callback_2.counter)
+        self.assertEqual({resources.PORT: set([events.AFTER_CREATE])},
+                         self.manager._index[manager._get_id(callback_1)])
+
+    def test_restore_snapshot_twice(self):
+        token = self.manager.snapshot()
+        for _i in range(2):
+            self.manager.subscribe(
+                callback_1, resources.PORT, events.AFTER_CREATE)
+            self.manager.restore(token)
+        self.manager.notify(resources.PORT, events.AFTER_CREATE, self)
+        self.assertEqual(0, callback_1.counter)
+
+    def test_snapshot_shares_subscriptions(self):
+        self.manager.subscribe(
+            callback_1, resources.PORT, events.AFTER_CREATE)
+        self.manager.subscribe(
+            callback_1, resources.ROUTER, events.AFTER_CREATE)
+        token = self.manager.snapshot()
+        self.manager.subscribe(
+            callback_2, resources.PORT, events.AFTER_CREATE)
+        self.assertIs(token.callbacks[resources.ROUTER][events.AFTER_CREATE],
+                      self.manager._callbacks[resources.ROUTER][
+                          events.AFTER_CREATE])
+        self.assertEqual(
+            1, len(token.callbacks[resources.PORT][events.AFTER_CREATE]))
+
+    def test_restore_keeps_coalesce_windows(self):
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0.5)
+        token = self.manager.snapshot()
+        self.manager.coalesce(resources.PORT, events.AFTER_UPDATE, 0)
+        self.manager.restore(token)
+        self.assertEqual(
+            {(resources.PORT, events.AFTER_UPDATE):
+             {'received': 0, 'dispatched': 0, 'suppressed': 0}},
+            self.manager.get_coalesce_counters())
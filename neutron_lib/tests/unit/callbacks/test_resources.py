@@ -0,0 +1,27 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron_lib.callbacks import resources
+from neutron_lib.tests import base
+
+
+class ResourceRegistryTestCase(base.BaseTestCase):
+
+    def test_core_resources_registered(self):
+        self.assertIn(resources.PORT, resources.get_resources())
+        self.assertIn(resources.SUBNET_GATEWAY, resources.get_resources())
+
+    def test_register_interns(self):
+        resource = ''.join(['frob', 'nicator'])
+        self.assertIs(resources.register('frobnicator'),
+                      resources.register(resource))
+        self.assertIn(resource, resources.get_resources())
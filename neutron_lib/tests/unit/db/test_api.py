@@ -0,0 +1,466 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_db import exception as db_exc
+from oslo_db.sqlalchemy import models
+from oslo_utils import timeutils
+import sqlalchemy as sa
+from sqlalchemy.ext import declarative
+from sqlalchemy import orm
+
+from neutron_lib.callbacks import events
+from neutron_lib.callbacks import exceptions as cb_exc
+from neutron_lib.callbacks import resources
+from neutron_lib.common import exceptions as n_exc
+from neutron_lib.db import api as db_api
+from neutron_lib.tests import base
+
+BASE = declarative.declarative_base(cls=models.ModelBase)
+
+
+class FakeModel(BASE):
+    __tablename__ = 'fake_models'
+
+    id = sa.Column(sa.String(36), primary_key=True)
+    tenant_id = sa.Column(sa.String(255))
+    name = sa.Column(sa.String(255))
+
+
+class FakeStatusModel(BASE):
+    __tablename__ = 'fake_status_models'
+
+    id = sa.Column(sa.String(36), primary_key=True)
+    _status = sa.Column('status', sa.String(16))
+
+
+class DbApiTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(DbApiTestCase, self).setUp()
+        engine = sa.create_engine('sqlite://')
+        BASE.metadata.create_all(engine)
+        self.context = mock.Mock(is_admin=False, is_advsvc=False,
+                                 tenant_id='tenant')
+        self.context.session = orm.sessionmaker(
+            bind=engine, autocommit=True, expire_on_commit=False)()
+
+    def _create(self, count, tenant_id='tenant', name='fake', start=0):
+        with self.context.session.begin():
+            for i in range(start, start + count):
+                self.context.session.add(FakeModel(
+                    id='%s-%03d' % (tenant_id, i), tenant_id=tenant_id,
+                    name=name))
+        self.context.session.expunge_all()
+
+
+class IterObjectsTestCase(DbApiTestCase):
+
+    def test_iter_objects(self):
+        self._create(7)
+        self._create(2, tenant_id='other')
+        ids = [db_obj.id for db_obj in db_api.iter_objects(
+            self.context, FakeModel, batch_size=3)]
+        self.assertEqual(['tenant-%03d' % i for i in range(7)], ids)
+
+    def test_iter_objects_with_filters(self):
+        self._create(2)
+        self._create(1, name='other', start=2)
+        self.assertEqual([], list(db_api.iter_objects(
+            self.context, FakeModel, name='nope')))
+        self.assertEqual(2, len(list(db_api.iter_objects(
+            self.context, FakeModel, batch_size=2, name='fake'))))
+
+    def test_iter_objects_expunges_batches(self):
+        self._create(4)
+        loaded = db_api.get_object(self.context, FakeModel, id='tenant-000')
+        iterator = db_api.iter_objects(self.context, FakeModel, batch_size=2)
+        first = next(iterator)
+        second = next(iterator)
+        self.assertIn(second, self.context.session)
+        third = next(iterator)
+        self.assertIs(loaded, first)
+        self.assertIn(first, self.context.session)
+        self.assertNotIn(second, self.context.session)
+        self.assertIn(third, self.context.session)
+        self.assertEqual(1, len(list(iterator)))
+
+
+class NotifyAfterCommitTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(NotifyAfterCommitTestCase, self).setUp()
+        engine = sa.create_engine('sqlite://')
+        self.context = mock.Mock()
+        self.context.session = orm.sessionmaker(
+            bind=engine, autocommit=True)()
+        notify = mock.patch.object(db_api.registry, 'notify').start()
+        self.addCleanup(mock.patch.stopall)
+        self.notify = notify
+
+    def _notify(self, event=events.AFTER_CREATE):
+        db_api.notify_after_commit(self.context, resources.PORT, event,
+                                   self, port_id='fake')
+
+    def test_notify_outside_transaction(self):
+        self._notify()
+        self.notify.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self, port_id='fake')
+
+    def test_notify_deferred_until_commit(self):
+        with self.context.session.begin():
+            with self.context.session.begin(subtransactions=True):
+                self._notify()
+            self.assertFalse(self.notify.called)
+        self.notify.assert_called_once_with(
+            resources.PORT, events.AFTER_CREATE, self, port_id='fake')
+
+    def test_notify_dropped_on_rollback(self):
+        try:
+            with self.context.session.begin():
+                self._notify()
+                raise ValueError()
+        except ValueError:
+            pass
+        with self.context.session.begin():
+            pass
+        self.assertFalse(self.notify.called)
+
+    def test_notify_dropped_on_subtransaction_rollback(self):
+        transaction = self.context.session.begin()
+        try:
+            with self.context.session.begin(subtransactions=True):
+                self._notify()
+                raise ValueError()
+        except ValueError:
+            pass
+        # The outermost transaction can only be rolled back after a
+        # subtransaction was.
+        transaction.rollback()
+        self.assertFalse(self.notify.called)
+
+    def test_notify_dropped_on_savepoint_rollback(self):
+        with self.context.session.begin():
+            self._notify(events.AFTER_UPDATE)
+            try:
+                with self.context.session.begin_nested():
+                    self._notify()
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.notify.assert_called_once_with(
+            resources.PORT, events.AFTER_UPDATE, self, port_id='fake')
+
+    def test_notify_dropped_on_close(self):
+        self.context.session.begin()
+        self._notify()
+        self.context.session.close()
+        self.assertFalse(self.notify.called)
+
+    def test_notify_before_event_invalid(self):
+        self.assertRaises(cb_exc.Invalid, self._notify, events.BEFORE_CREATE)
+
+
+class BulkObjectsTestCase(DbApiTestCase):
+
+    def _get_names(self):
+        self.context.session.expunge_all()
+        return dict((db_obj.id, db_obj.name)
+                    for db_obj in db_api.get_objects(self.context, FakeModel))
+
+    def test_create_objects(self):
+        values_list = db_api.create_objects(
+            self.context, FakeModel,
+            [{'id': 'a', 'tenant_id': 'tenant', 'name': 'x'},
+             {'tenant_id': 'tenant', 'name': 'y'}])
+        self.assertEqual('a', values_list[0]['id'])
+        self.assertEqual(
+            {'a': 'x', values_list[1]['id']: 'y'}, self._get_names())
+
+    def test_create_objects_with_different_columns(self):
+        db_api.create_objects(
+            self.context, FakeModel,
+            [{'id': 'a', 'tenant_id': 'tenant', 'name': 'x'},
+             {'id': 'b', 'tenant_id': 'tenant'},
+             {'id': 'c', 'tenant_id': 'tenant'}])
+        self.assertEqual({'a': 'x', 'b': None, 'c': None}, self._get_names())
+
+    def test_create_objects_empty(self):
+        self.assertEqual([], db_api.create_objects(
+            self.context, FakeModel, []))
+
+    def test_update_objects(self):
+        self._create(3)
+        with mock.patch.object(db_api, '_find_ids') as find_ids:
+            self.assertEqual([], db_api.update_objects(
+                self.context, FakeModel, ['tenant-000', 'tenant-002'],
+                {'name': 'new'}))
+        self.assertFalse(find_ids.called)
+        self.assertEqual({'tenant-000': 'new', 'tenant-001': 'fake',
+                          'tenant-002': 'new'}, self._get_names())
+
+    def test_update_objects_reports_missing(self):
+        self._create(1)
+        self._create(1, tenant_id='other')
+        self.assertEqual(['nope', 'other-000'], db_api.update_objects(
+            self.context, FakeModel, ['nope', 'tenant-000', 'other-000'],
+            {'name': 'new'}))
+        self.assertEqual({'tenant-000': 'new'}, self._get_names())
+
+    def test_update_objects_expires_loaded_objects(self):
+        self._create(1)
+        db_obj = db_api.get_object(self.context, FakeModel, id='tenant-000')
+        db_api.update_objects(self.context, FakeModel, ['tenant-000'],
+                              {'name': 'new'})
+        self.assertEqual('new', db_obj.name)
+
+    def test_delete_objects(self):
+        self._create(3)
+        db_obj = db_api.get_object(self.context, FakeModel, id='tenant-001')
+        self.assertEqual(['nope'], db_api.delete_objects(
+            self.context, FakeModel, ['tenant-001', 'nope', 'tenant-002']))
+        self.assertNotIn(db_obj, self.context.session)
+        self.assertEqual({'tenant-000': 'fake'}, self._get_names())
+
+    def test_delete_objects_out_of_scope(self):
+        self._create(1, tenant_id='other')
+        self.assertEqual(['other-000'], db_api.delete_objects(
+            self.context, FakeModel, ['other-000']))
+        self.context.is_admin = True
+        self.assertEqual({'other-000': 'fake'}, self._get_names())
+
+
+class SingleStatementTestCase(DbApiTestCase):
+
+    def test_update_object_without_load(self):
+        self._create(1)
+        with mock.patch.object(db_api, 'get_object') as get_object:
+            self.assertEqual(
+                {'id': 'tenant-000', 'name': 'new'},
+                db_api.update_object(self.context, FakeModel, 'tenant-000',
+                                     {'name': 'new'}, load=False))
+        self.assertFalse(get_object.called)
+        self.context.session.expunge_all()
+        self.assertEqual('new', db_api.get_object(
+            self.context, FakeModel, id='tenant-000').name)
+
+    def test_update_object_without_load_not_found(self):
+        self._create(1, tenant_id='other')
+        self.assertRaises(n_exc.ObjectNotFound, db_api.update_object,
+                          self.context, FakeModel, 'other-000',
+                          {'name': 'new'}, load=False)
+
+    def test_delete_object_without_load(self):
+        self._create(1)
+        db_obj = db_api.get_object(self.context, FakeModel, id='tenant-000')
+        db_api.delete_object(self.context, FakeModel, 'tenant-000',
+                             load=False)
+        self.assertNotIn(db_obj, self.context.session)
+        self.assertIsNone(db_api.get_object(
+            self.context, FakeModel, id='tenant-000'))
+
+    def test_delete_object_without_load_not_found(self):
+        self.assertRaises(n_exc.ObjectNotFound, db_api.delete_object,
+                          self.context, FakeModel, 'nope', load=False)
+
+
+class CompactResultsTestCase(DbApiTestCase):
+
+    def test_create_object_compact(self):
+        row = db_api.create_object(
+            self.context, FakeModel, {'tenant_id': 'tenant', 'name': 'x'},
+            compact=True)
+        self.assertEqual(('id', 'tenant_id', 'name'), row._fields)
+        self.assertEqual('x', row.name)
+        self.assertFalse(hasattr(row, '__dict__'))
+
+    def test_update_object_compact(self):
+        self._create(1)
+        row = db_api.update_object(self.context, FakeModel, 'tenant-000',
+                                   {'name': 'new'}, compact=True)
+        self.assertEqual(('tenant-000', 'tenant', 'new'), tuple(row))
+
+    def test_compact_underscore_column(self):
+        row = db_api.create_object(
+            self.context, FakeStatusModel, {'id': 'a', '_status': 'ACTIVE'},
+            compact=True)
+        self.assertEqual({'id': 'a', '_status': 'ACTIVE'}, row._asdict())
+        self.assertEqual('ACTIVE', row._status)
+        self.assertRaises(AttributeError, setattr, row, '_status', 'DOWN')
+        self.assertEqual([tuple(row)],
+                         [tuple(r) for r in db_api.get_rows(
+                             self.context, FakeStatusModel)])
+
+    def test_get_rows(self):
+        self._create(2)
+        self._create(1, tenant_id='other')
+        rows = db_api.get_rows(self.context, FakeModel)
+        self.assertEqual([('tenant-000', 'tenant', 'fake'),
+                          ('tenant-001', 'tenant', 'fake')],
+                         sorted(tuple(row) for row in rows))
+        self.assertEqual(0, len(self.context.session.identity_map))
+
+    def test_get_rows_with_fields_and_filters(self):
+        self._create(2)
+        rows = db_api.get_rows(self.context, FakeModel, fields=['name'],
+                               id='tenant-001')
+        self.assertEqual(1, len(rows))
+        self.assertEqual('fake', rows[0].name)
+
+
+class RetryTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(RetryTestCase, self).setUp()
+        self.sleep = mock.patch.object(db_api.time, 'sleep').start()
+        mock.patch.object(db_api.random, 'uniform',
+                          side_effect=lambda low, high: high).start()
+        mock.patch.dict(db_api._RETRY_STATS, clear=True).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _decorate(self, errors, **kwargs):
+        func = mock.Mock(side_effect=errors, __name__='func')
+        return func, db_api.wrap_db_retry(**kwargs)(func)
+
+    def _get_stats(self):
+        (stats,) = db_api.get_retry_stats().values()
+        return stats
+
+    def test_retry_deadlock_with_backoff(self):
+        func, wrapped = self._decorate(
+            [db_exc.DBDeadlock(), db_exc.DBDeadlock(), 'ok'],
+            retry_interval=0.5, max_retry_interval=0.8)
+        self.assertEqual('ok', wrapped())
+        self.assertEqual([mock.call(0.5), mock.call(0.8)],
+                         self.sleep.call_args_list)
+        stats = self._get_stats()
+        self.assertEqual(1, stats['calls'])
+        self.assertEqual(2, stats['retries'])
+        self.assertEqual(2, stats['deadlocks'])
+
+    def test_retries_exhausted(self):
+        func, wrapped = self._decorate(db_exc.DBDeadlock(), max_retries=2)
+        self.assertRaises(db_exc.DBDeadlock, wrapped)
+        self.assertEqual(3, func.call_count)
+        self.assertEqual(1, self._get_stats()['exhausted'])
+
+    def test_time_budget_exhausted(self):
+        func, wrapped = self._decorate(db_exc.DBDeadlock(), time_budget=0.8,
+                                       retry_interval=0.3)
+        watch = mock.patch.object(db_api.timeutils, 'StopWatch').start()
+        watch.return_value.start.return_value.elapsed.side_effect = (
+            lambda: sum(c[0][0] for c in self.sleep.call_args_list))
+        self.assertRaises(db_exc.DBDeadlock, wrapped)
+        # Slept 0.3, the next sleep of 0.6 would overrun the budget.
+        self.assertEqual(2, func.call_count)
+
+    def test_retry_request_raises_inner_exception(self):
+        func, wrapped = self._decorate(
+            db_exc.RetryRequest(ValueError()), max_retries=1)
+        self.assertRaises(ValueError, wrapped)
+        self.assertEqual(2, self._get_stats()['retry_requests'])
+
+    def test_no_retry_on_other_errors(self):
+        func, wrapped = self._decorate(
+            [db_exc.DBDuplicateEntry(), db_exc.DBConnectionError()])
+        self.assertRaises(db_exc.DBDuplicateEntry, wrapped)
+        self.assertRaises(db_exc.DBConnectionError, wrapped)
+        self.assertEqual(0, self._get_stats()['retries'])
+
+    def test_retry_on_duplicate_and_connection_error(self):
+        func, wrapped = self._decorate(
+            [db_exc.DBDuplicateEntry(), db_exc.DBConnectionError(), 'ok'],
+            retry_on_duplicate=True, retry_on_connection_error=True)
+        self.assertEqual('ok', wrapped())
+        stats = self._get_stats()
+        self.assertEqual(1, stats['duplicates'])
+        self.assertEqual(1, stats['connection_errors'])
+
+    def test_exception_checker(self):
+        func, wrapped = self._decorate(
+            [ValueError(), 'ok'],
+            exception_checker=lambda e: isinstance(e, ValueError))
+        self.assertEqual('ok', wrapped())
+        self.assertEqual(1, self._get_stats()['other_errors'])
+
+
+class ReadRoutingTestCase(DbApiTestCase):
+
+    def setUp(self):
+        super(ReadRoutingTestCase, self).setUp()
+        self.reader = orm.sessionmaker(
+            bind=self.context.session.bind, autocommit=True)()
+        self.get_session = mock.patch.object(
+            db_api, 'get_session', return_value=self.reader).start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(db_api.set_read_routing, False)
+        db_api.set_read_routing(True, pin_time=10)
+        self._create(2)
+
+    def _pass_time(self, seconds):
+        mock.patch.object(db_api.timeutils, 'now',
+                          return_value=timeutils.now() + seconds).start()
+
+    def test_routing_disabled(self):
+        db_api.set_read_routing(False)
+        self.assertIs(self.context.session,
+                      db_api.get_reader_session(self.context))
+
+    def test_reads_go_to_replica(self):
+        self._pass_time(60)
+        self.assertIs(self.reader, db_api.get_reader_session(self.context))
+        db_obj = db_api.get_object(self.context, FakeModel, id='tenant-000')
+        self.assertIn(db_obj, self.reader)
+        self.assertEqual(2, len(db_api.get_objects(self.context, FakeModel)))
+        self.assertEqual(2, len(db_api.get_rows(self.context, FakeModel)))
+        self.get_session.assert_called_once_with(use_slave=True)
+
+    def test_reads_pinned_to_primary_after_write(self):
+        self.assertIs(self.context.session,
+                      db_api.get_reader_session(self.context))
+        self._pass_time(60)
+        db_api.update_objects(self.context, FakeModel, ['tenant-000'],
+                              {'name': 'new'})
+        self.assertIs(self.context.session,
+                      db_api.get_reader_session(self.context))
+
+    def test_pin_time_runs_from_commit(self):
+        self._pass_time(60)
+        with self.context.session.begin():
+            self.context.session.add(
+                FakeModel(id='new', tenant_id='tenant'))
+            self.context.session.flush()
+            self._pass_time(120)
+        self.assertIs(self.context.session,
+                      db_api.get_reader_session(self.context))
+        self._pass_time(135)
+        self.assertIs(self.reader, db_api.get_reader_session(self.context))
+
+    def test_rolled_back_writes_do_not_pin(self):
+        self._pass_time(60)
+        try:
+            with self.context.session.begin():
+                self.context.session.add(
+                    FakeModel(id='new', tenant_id='tenant'))
+                self.context.session.flush()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertIs(self.reader, db_api.get_reader_session(self.context))
+
+    def test_reads_within_transaction_use_primary(self):
+        self._pass_time(60)
+        with self.context.session.begin():
+            self.assertIs(self.context.session,
+                          db_api.get_reader_session(self.context))
+            db_api.get_object(self.context, FakeModel, id='tenant-000')
+        self.assertFalse(self.get_session.called)